@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# token introspection for reverse proxies, outside the middleware stack;
+# imported after get_asgi_application(), which sets Django up
+from config.introspect import mount_asgi  # noqa: E402
+
+application = mount_asgi(application)
@@ -0,0 +1,28 @@
+# Условные GET: сильный ETag из того, что определяет тело ответа,
+# и 304 на совпавший If-None-Match — до загрузки объекта и сериализации.
+import hashlib
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+
+def make_etag(*parts) -> str:
+    # parts must change whenever the rendered body does (id, updated_at, ...)
+    raw = "\x1f".join(map(str, parts)).encode()
+    return '"%s"' % hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def etag_matches(request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison (RFC 9110, 13.1.2)
+    etags = parse_etags(header)
+    return "*" in etags or any(e.removeprefix("W/") == etag for e in etags)
+
+
+def set_etag(response, etag: str):
+    response["ETag"] = etag
+    # bodies are per caller: no shared caches, clients revalidate every time
+    patch_vary_headers(response, ["Authorization"])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,100 @@
+# Чтение — с реплик, запись — в primary.
+# Реплики используются только внутри HTTP-запроса с безопасным методом (GET/HEAD/OPTIONS),
+# и только пока запрос ничего не записал. Кто записал, тот ещё PIN_SECONDS читает
+# из primary (read-your-writes), см. ReplicaRoutingMiddleware.
+import random
+from contextvars import ContextVar
+from typing import Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+# read from the primary even in replica mode: the rule matrix is cached per
+# RBAC version, so the version and the rules must come from the same database
+PRIMARY_MODELS = {"users.RbacVersion", "users.AccessRule", "users.UserAccessEpoch"}
+
+
+def get_replica_config() -> dict:
+    return {
+        "ALIASES": [],
+        "PIN_SECONDS": 5,
+        "CACHE_ALIAS": "default",
+        **getattr(settings, "DATABASE_REPLICAS", {}),
+    }
+
+
+class RoutingState:
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned: bool):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# state of the request being served; None outside requests = primary only
+_state: ContextVar[Optional[RoutingState]] = ContextVar("db_routing", default=None)
+
+
+def start_request(pinned: bool) -> RoutingState:
+    state = RoutingState(pinned)
+    _state.set(state)
+    return state
+
+
+def finish_request():
+    _state.set(None)
+
+
+def _pin_key(key: str) -> str:
+    return f"db:pin:{key}"
+
+
+def is_pinned(key: Optional[str]) -> bool:
+    if key is None:
+        return False
+    config = get_replica_config()
+    return caches[config["CACHE_ALIAS"]].get(_pin_key(key)) is not None
+
+
+def pin(key: Optional[str]):
+    # the caller's next requests read from the primary for PIN_SECONDS
+    if key is None:
+        return
+    config = get_replica_config()
+    caches[config["CACHE_ALIAS"]].set(_pin_key(key), 1, config["PIN_SECONDS"])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned:
+            return PRIMARY
+        if model._meta.label in PRIMARY_MODELS:
+            return PRIMARY
+        # reads inside a transaction must see its writes
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+
+        replicas = get_replica_config()["ALIASES"]
+        if not replicas:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        databases = {PRIMARY, *get_replica_config()["ALIASES"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,160 @@
+# Интроспекция токена для reverse proxy (nginx auth_request, Envoy ext_authz):
+# голый WSGI/ASGI-обработчик на INTROSPECTION_PATH, мимо middleware, DRF и роутинга.
+# Токен, отзыв, пользователь и правила — из тех же in-process кэшей, что и у API,
+# так что обычная проверка вообще не ходит в БД.
+#
+#   GET /api/auth/introspect/
+#   Authorization: Bearer <access>
+#   X-Element-Code: task          (или ?element=task; без него — только токен)
+#   X-Original-Method: PATCH      (или ?method=PATCH; по умолчанию GET)
+#
+# 200 / 401 / 403 без тела; при 200 и 403 — X-User-Id и X-User-Role (percent-encoded).
+import time
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import parse_qs, quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from users.principal import (
+    aprincipal_from_token,
+    parse_bearer_token,
+    principal_from_token,
+)
+from users.rbac import METHOD_ANY_BITS
+from . import metrics
+
+DEFAULT_PATH = "/api/auth/introspect/"
+ROUTE = "introspect"
+
+STATUS_LINES = {
+    status: f"{status.value} {status.phrase}"
+    for status in (HTTPStatus.OK, HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN)
+}
+
+
+def get_introspection_path() -> str:
+    return getattr(settings, "INTROSPECTION_PATH", DEFAULT_PATH)
+
+
+def decide(
+    principal, user, element_code: Optional[str], method: str
+) -> tuple[HTTPStatus, list]:
+    """
+    (status, headers) for a resolved principal and its user.
+    """
+    headers = [("Content-Length", "0"), ("Cache-Control", "no-store")]
+    if not principal.is_authenticated or user is None:
+        headers.append(("WWW-Authenticate", "Bearer"))
+        return HTTPStatus.UNAUTHORIZED, headers
+
+    headers.append(("X-User-Id", str(user.pk)))
+    # header values are latin-1: the role name goes percent-encoded (UTF-8)
+    role = quote(user.role.name, safe="") if user.role_id else ""
+    headers.append(("X-User-Role", role))
+    if element_code:
+        # view-level check, the same as AccessRulePermission.has_permission
+        mask = principal.get_mask(element_code)
+        if not mask & METHOD_ANY_BITS.get(method.upper(), 0):
+            return HTTPStatus.FORBIDDEN, headers
+    return HTTPStatus.OK, headers
+
+
+def _query_params(query_string: str) -> tuple[Optional[str], Optional[str]]:
+    if not query_string:
+        return None, None
+    params = parse_qs(query_string)
+    element = params.get("element")
+    method = params.get("method")
+    return element and element[0], method and method[0]
+
+
+def _finish(request_metrics, method: str, status: HTTPStatus):
+    if metrics.metrics_enabled():
+        total = time.perf_counter() - request_metrics.started
+        metrics.registry.observe(ROUTE, method, int(status), total, request_metrics)
+
+
+def check_wsgi(environ) -> tuple[HTTPStatus, list]:
+    element, method = _query_params(environ.get("QUERY_STRING", ""))
+    element = environ.get("HTTP_X_ELEMENT_CODE") or element
+    method = environ.get("HTTP_X_ORIGINAL_METHOD") or method or "GET"
+
+    principal = principal_from_token(
+        parse_bearer_token(environ.get("HTTP_AUTHORIZATION"))
+    )
+    return decide(principal, principal.user, element, method)
+
+
+def wsgi_introspect(environ, start_response):
+    request_metrics = metrics.start_request()
+    try:
+        status, headers = check_wsgi(environ)
+    finally:
+        metrics.finish_request()
+        # no request_started/finished signals here: only a cache miss
+        # touches the DB, and only then the connection needs the usual care
+        if request_metrics.queries:
+            close_old_connections()
+    _finish(request_metrics, environ.get("REQUEST_METHOD", "GET"), status)
+    start_response(STATUS_LINES[status], headers)
+    return [b""]
+
+
+async def check_asgi(scope) -> tuple[HTTPStatus, list]:
+    headers = {}
+    for name, value in scope.get("headers", ()):
+        if name in (b"authorization", b"x-element-code", b"x-original-method"):
+            headers[name] = value.decode("latin-1")
+    element, method = _query_params(scope.get("query_string", b"").decode("latin-1"))
+    element = headers.get(b"x-element-code") or element
+    method = headers.get(b"x-original-method") or method or "GET"
+
+    principal = await aprincipal_from_token(
+        parse_bearer_token(headers.get(b"authorization"))
+    )
+    return decide(principal, await principal.auser(), element, method)
+
+
+async def asgi_introspect(scope, receive, send):
+    request_metrics = metrics.start_request()
+    try:
+        status, headers = await check_asgi(scope)
+    finally:
+        metrics.finish_request()
+        if request_metrics.queries:
+            await sync_to_async(close_old_connections)()
+    _finish(request_metrics, scope.get("method", "GET"), status)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": int(status),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": b""})
+
+
+def mount_wsgi(application):
+    """
+    WSGI app: INTROSPECTION_PATH goes to wsgi_introspect, everything else to Django.
+    """
+    path = get_introspection_path()
+
+    def dispatch(environ, start_response):
+        if environ.get("PATH_INFO") == path:
+            return wsgi_introspect(environ, start_response)
+        return application(environ, start_response)
+
+    return dispatch
+
+
+def mount_asgi(application):
+    path = get_introspection_path()
+
+    async def dispatch(scope, receive, send):
+        if scope["type"] == "http" and scope.get("path") == path:
+            return await asgi_introspect(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return dispatch
@@ -0,0 +1,327 @@
+# Метрики запросов: число SQL-запросов, время в БД и по этапам (auth, perm, serialize)
+# на каждый запрос — в заголовок Server-Timing и в гистограммы процесса,
+# которые отдаёт GET /metrics в текстовом формате Prometheus.
+# Дёшево: пара perf_counter() на этап, одна гистограмма — bisect под локом.
+import hmac
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from typing import Optional
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.throttling import BaseThrottle
+
+STAGES = ("auth", "perm", "serialize", "db")
+
+# seconds; the last bucket is +Inf
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    __slots__ = ("started", "queries", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+
+    def server_timing(self, total: float) -> str:
+        parts = [
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()
+        ]
+        parts.append(f'queries;desc="{self.queries}"')
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# metrics of the request being served; copied into sync_to_async threads
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def start_request() -> RequestMetrics:
+    metrics = RequestMetrics()
+    _current.set(metrics)
+    return metrics
+
+
+def finish_request():
+    _current.set(None)
+
+
+class timer(ContextDecorator):
+    """
+    Adds the time spent inside to a stage of the current request:
+    `with timer("auth"): ...` or `@timer("perm")`. Outside a request it is a no-op.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # as a decorator: a fresh instance per call, so threads don't share state
+        return type(self)(self.stage)
+
+    def __enter__(self):
+        self._metrics = _current.get()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._metrics is not None:
+            self._metrics.stages[self.stage] += time.perf_counter() - self._started
+        return False
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.stages["db"] += time.perf_counter() - started
+
+
+def install_db_wrapper(connection):
+    # installed once per connection, for its whole lifetime
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_db_wrapper(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+# --- aggregation ---
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Per-process aggregates keyed by (route, method).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}  # (route, method) -> Histogram
+        self.stages = {}  # (route, method, stage) -> Histogram
+        self.queries = {}  # (route, method) -> Histogram
+        self.responses = {}  # (route, method, status) -> count
+
+    def _histogram(self, table: dict, key, buckets) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def observe(self, route: str, method: str, status: int, total: float, metrics):
+        key = (route, method)
+        with self._lock:
+            self._histogram(self.durations, key, DURATION_BUCKETS).observe(total)
+            self._histogram(self.queries, key, QUERY_BUCKETS).observe(metrics.queries)
+            for stage, seconds in metrics.stages.items():
+                self._histogram(
+                    self.stages, (route, method, stage), DURATION_BUCKETS
+                ).observe(seconds)
+            status_key = (route, method, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def snapshot(self) -> dict:
+        # copies, so rendering does not hold the lock
+        def copy(table):
+            result = {}
+            for key, h in table.items():
+                c = Histogram(h.buckets)
+                c.counts, c.sum, c.count = list(h.counts), h.sum, h.count
+                result[key] = c
+            return result
+
+        with self._lock:
+            return {
+                "durations": copy(self.durations),
+                "stages": copy(self.stages),
+                "queries": copy(self.queries),
+                "responses": dict(self.responses),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.durations.clear()
+            self.stages.clear()
+            self.queries.clear()
+            self.responses.clear()
+
+
+registry = Registry()
+
+
+def metrics_enabled() -> bool:
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+# --- Prometheus text format ---
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+def _render_histogram(lines, name, help_text, table, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, h in sorted(table.items()):
+        labels = _labels(**dict(zip(label_names, key)))
+        cumulative = 0
+        for bound, count in zip(h.buckets, h.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+        lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+        lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+
+def _render_gauges(lines, name, help_text, values: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    for key, value in values.items():
+        lines.append(f"{name}{{{_labels(stat=key)}}} {value}")
+
+
+def component_stats() -> dict:
+    """
+    Counters of the auth stack's in-process components: {metric name: {stat: value}}.
+    """
+    from users.cache import get_user_cache
+    from users.hashing import get_hasher_pool
+    from users.services import get_token_cache
+
+    stats = {"auth_user_cache": get_user_cache().stats()}
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        stats["auth_token_cache"] = token_cache.stats()
+    pool = get_hasher_pool()
+    if pool is not None:
+        stats["auth_password_hasher"] = pool.stats()
+    # psycopg connection pool (DB_POOL=1)
+    db_pool = getattr(connections[DEFAULT_DB_ALIAS], "pool", None)
+    if db_pool is not None:
+        stats["db_pool"] = db_pool.get_stats()
+    return stats
+
+
+def render_prometheus() -> str:
+    data = registry.snapshot()
+    lines = []
+    _render_histogram(
+        lines,
+        "http_request_duration_seconds",
+        "Request latency by route.",
+        data["durations"],
+        ("route", "method"),
+    )
+    _render_histogram(
+        lines,
+        "http_request_stage_seconds",
+        "Time per request spent in auth, permission checks, serialization and the DB.",
+        data["stages"],
+        ("route", "method", "stage"),
+    )
+    _render_histogram(
+        lines,
+        "http_request_db_queries",
+        "SQL queries per request.",
+        data["queries"],
+        ("route", "method"),
+    )
+    lines.append("# HELP http_responses_total Responses by route and status.")
+    lines.append("# TYPE http_responses_total counter")
+    for (route, method, status), count in sorted(data["responses"].items()):
+        labels = _labels(route=route, method=method, status=status)
+        lines.append(f"http_responses_total{{{labels}}} {count}")
+
+    for name, values in component_stats().items():
+        _render_gauges(lines, name, f"{name} counters.", values)
+    return "\n".join(lines) + "\n"
+
+
+def get_metrics_access() -> dict:
+    return {
+        "TOKEN": None,
+        "ALLOWED_IPS": [],
+        **getattr(settings, "METRICS_ACCESS", {}),
+    }
+
+
+def metrics_allowed(request) -> bool:
+    # the scraper's bearer token, or a client address from ALLOWED_IPS (CIDR ok)
+    config = get_metrics_access()
+    token = config["TOKEN"]
+    if token:
+        header = request.headers.get("Authorization", "")
+        if hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+
+    # the client address as the throttles see it (NUM_PROXIES): behind a proxy
+    # on the same host REMOTE_ADDR is 127.0.0.1 for everyone
+    try:
+        address = ipaddress.ip_address(BaseThrottle().get_ident(request))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in config["ALLOWED_IPS"]
+    )
+
+
+# GET /metrics — only for the scraper: internal counters are not public
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
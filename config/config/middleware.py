@@ -1,13 +1,160 @@
-from django.utils.deprecation import MiddlewareMixin
-from users.services import get_user_from_request
+import time
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+from users.principal import aget_principal, get_bearer_token, get_principal
+from users.services import decode_access_token
+from . import db_router, metrics
 
 
-class JWTAuthenticationMiddleware(MiddlewareMixin):
-    def process_request(self, request):
+class JWTAuthenticationMiddleware:
+    # работает и под WSGI, и нативно под ASGI — без sync_to_async на каждый запрос
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with metrics.timer("auth"):
+            principal = get_principal(request)
+        self.process_request(request, principal)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        with metrics.timer("auth"):
+            principal = await aget_principal(request)
+        self.process_request(request, principal)
+        return await self.get_response(request)
+
+    def process_request(self, request, principal):
         # по умолчанию
         request.api_user = None
 
-        user = get_user_from_request(request)
-        if user is not None:
+        # principal резолвится один раз и кэшируется на request;
+        # сам User грузим лениво — токену с вшитыми правами он обычно не нужен
+        if principal.is_authenticated:
+            user = SimpleLazyObject(lambda: principal.user)
             request.user = user
             request.api_user = user
+
+
+class RequestMetricsMiddleware:
+    """
+    Первый в MIDDLEWARE: меряет весь запрос, пишет Server-Timing
+    и складывает цифры в гистограммы для GET /metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.metrics_enabled():
+            return self.get_response(request)
+
+        # connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            metrics.install_db_wrapper(connection)
+
+        request_metrics = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request()
+        return self.process_response(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        if not metrics.metrics_enabled():
+            return await self.get_response(request)
+
+        request_metrics = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request()
+        return self.process_response(request, response, request_metrics)
+
+    def process_response(self, request, response, request_metrics):
+        total = time.perf_counter() - request_metrics.started
+        response["Server-Timing"] = request_metrics.server_timing(total)
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        metrics.registry.observe(
+            route, request.method, response.status_code, total, request_metrics
+        )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Перед JWTAuthenticationMiddleware: включает чтение с реплик для запроса.
+    Небезопасные методы и вызывающие, которые недавно писали, идут в primary;
+    если запрос что-то записал, вызывающий прилипает к primary на PIN_SECONDS.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def get_pin_key(request):
+        # the caller is the token's user; decoding is cached, no DB
+        token = get_bearer_token(request)
+        if not token:
+            return None
+        try:
+            user_id = decode_access_token(token).get("user_id")
+        except jwt.InvalidTokenError:
+            return None
+        return f"user:{user_id}" if user_id is not None else None
+
+    def start(self, request):
+        if not db_router.get_replica_config()["ALIASES"]:
+            return None, None
+        key = self.get_pin_key(request)
+        pinned = request.method not in self.safe_methods or db_router.is_pinned(key)
+        return key, db_router.start_request(pinned)
+
+    @staticmethod
+    def finish(key, state):
+        db_router.finish_request()
+        if state.wrote:
+            db_router.pin(key)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key, state = self.start(request)
+        if state is None:
+            return self.get_response(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(key, state)
+
+    async def __acall__(self, request):
+        key, state = self.start(request)
+        if state is None:
+            return await self.get_response(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(key, state)
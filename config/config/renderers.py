@@ -0,0 +1,83 @@
+import re
+from io import BytesIO
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .metrics import timer
+
+try:
+    import orjson
+except ImportError:  # optional: without it the stock json module is used
+    orjson = None
+
+UTF8 = {"utf-8", "utf8"}
+# orjson reads ints over 64 bits as floats, json as ints
+LONG_NUMBER = re.compile(rb"\d{19}")
+
+
+class TimedJSONRenderer(JSONRenderer):
+    # time spent serializing the response goes to the "serialize" stage
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class OrjsonRenderer(TimedJSONRenderer):
+    """
+    Same bytes as DRF's JSONRenderer (compact, UTF-8, \\u2028/\\u2029 escaped),
+    encoded by orjson. Indented output (browsable API, `; indent=4`), non-default
+    JSON settings and whatever orjson refuses (ints over 64 bits, lone surrogates)
+    go through DRF's encoder. The one difference: floats in exponent notation
+    are written as orjson does (1e-7, not 1e-07); no API response here has floats.
+    """
+
+    default = staticmethod(JSONEncoder().default)
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.encoder_class is not JSONEncoder
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        with timer("serialize"):
+            try:
+                # types orjson doesn't know (Decimal, lazy strings, ...) go to DRF's encoder
+                ret = orjson.dumps(data, default=self.default, option=self.options)
+            except orjson.JSONEncodeError:
+                return JSONRenderer.render(
+                    self, data, accepted_media_type, renderer_context
+                )
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class OrjsonParser(JSONParser):
+    """
+    JSONParser on orjson. Bodies orjson rejects are parsed once more by DRF,
+    so error messages stay the same; non-UTF-8 bodies, STRICT_JSON=False
+    (NaN/Infinity) and bodies with 19+ digit runs go to DRF right away.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower() not in UTF8:
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if not LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        # raises ParseError with json's message, or accepts what orjson doesn't
+        # (1e400 -> inf)
+        return super().parse(BytesIO(body), media_type, parser_context)
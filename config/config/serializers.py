@@ -0,0 +1,138 @@
+# Быстрый to_representation для горячих ModelSerializer'ов (пользователь, задачи).
+# DRF на каждый объект и поле проходит get_attribute/to_representation через
+# несколько уровней вызовов, а на каждый DateTimeField ещё и ищет текущую таймзону;
+# здесь чтение полей компилируется один раз на класс.
+from operator import attrgetter
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+from .metrics import timer
+
+# to_representation of these is the identity for values loaded from the DB
+# (str/int/bool), so the attribute can be returned as is
+PLAIN_FIELDS = {
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.EmailField,
+    serializers.BooleanField,
+}
+
+
+def _datetime_converter(field):
+    """
+    (value, current timezone) -> DRF's DateTimeField.to_representation(value).
+    """
+    to_representation = field.to_representation
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    if (
+        not settings.USE_TZ
+        or hasattr(field, "timezone")
+        or output_format is None
+        or output_format.lower() != ISO_8601
+    ):
+        return lambda value, tz: to_representation(value)
+
+    def convert(value, tz):
+        # naive values, strings and overflows: DRF's own conversion and errors
+        if isinstance(value, str) or value.utcoffset() is None:
+            return to_representation(value)
+        try:
+            value = value.astimezone(tz).isoformat()
+        except OverflowError:
+            return to_representation(value)
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return convert
+
+
+def _reader(serializer, field):
+    """
+    (getter, converter or None) giving the same value as DRF for one field;
+    None if the field is not supported.
+    """
+    if field.source == "*":
+        return None
+    model = serializer.Meta.model
+    kind = type(field)
+
+    if kind in PLAIN_FIELDS:
+        # dotted source ("role.name"): a None on the way raises AttributeError,
+        # the caller then falls back to DRF, which knows what to do with it
+        return attrgetter(field.source), None
+
+    if (
+        kind is PrimaryKeyRelatedField
+        and field.pk_field is None
+        and len(field.source_attrs) == 1
+    ):
+        # the FK column is already on the row, no need to touch the related object
+        model_field = model._meta.get_field(field.source)
+        if not (model_field.many_to_one and model_field.target_field.primary_key):
+            return None
+        return attrgetter(model_field.attname), None
+
+    if kind is serializers.DateTimeField:
+        return attrgetter(field.source), _datetime_converter(field)
+
+    return None
+
+
+class TimedDataMixin:
+    # serializer.data goes to the "serialize" stage too, not only the renderer
+    @property
+    def data(self):
+        with timer("serialize"):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class FastRepresentationMixin:
+    """
+    ModelSerializer mixin: output identical to DRF's to_representation, only
+    without the per-field dispatch. Works for IntegerField/CharField/EmailField/
+    BooleanField (dotted sources included), pk-only PrimaryKeyRelatedField and
+    DateTimeField; a serializer with any other readable field and non-model
+    instances (dicts) take the regular DRF path. The readers are compiled once
+    per class, so the set of fields must not depend on the instance.
+    """
+
+    def _fast_readers(self):
+        cls = type(self)
+        readers = cls.__dict__.get("_compiled_readers")
+        if readers is None:
+            prototype = cls()
+            compiled = []
+            for field in prototype._readable_fields:
+                reader = _reader(prototype, field)
+                if reader is None:
+                    compiled = False
+                    break
+                compiled.append((field.field_name, *reader))
+            readers = compiled and tuple(compiled)
+            cls._compiled_readers = readers
+        return readers
+
+    def to_representation(self, instance):
+        readers = self._fast_readers()
+        if not readers or not isinstance(instance, self.Meta.model):
+            return super().to_representation(instance)
+
+        # looked up once per object, not once per datetime field
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        ret = {}
+        try:
+            for name, get, convert in readers:
+                value = get(instance)
+                if convert is not None and value is not None:
+                    value = convert(value, tz)
+                ret[name] = value
+        except AttributeError:
+            return super().to_representation(instance)
+        return ret
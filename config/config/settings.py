@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -34,14 +35,30 @@ REST_FRAMEWORK = {
     # Мы аутентифицируемся сами через JWT в middleware,
     # поэтому стандартные SessionAuthentication/BasicAuthentication не нужны
     "DEFAULT_AUTHENTICATION_CLASSES": [],
+    # same as DRF's defaults, with JSON on orjson and timed for Server-Timing
+    "DEFAULT_RENDERER_CLASSES": [
+        "config.renderers.OrjsonRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "config.renderers.OrjsonParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # client IP for the auth throttles: REMOTE_ADDR, or the address appended by
+    # the last of NUM_PROXIES trusted proxies to X-Forwarded-For. Without it DRF
+    # takes X-Forwarded-For as is, and rotating it bypasses the per-IP limit
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", "0")),
 }
 
 MIDDLEWARE = [
+    "config.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "config.middleware.ReplicaRoutingMiddleware",
     "config.middleware.JWTAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -69,17 +86,71 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Everything can be overridden from the environment, e.g. DB_ENGINE=django.db.backends.sqlite3
+# DB_NAME=db.sqlite3 for a quick local run.
+#
+# Connections: DB_POOL=1 turns on psycopg 3's connection pool (DB_POOL_MIN_SIZE,
+# DB_POOL_MAX_SIZE, DB_POOL_MAX_LIFETIME, DB_POOL_MAX_IDLE, DB_POOL_TIMEOUT).
+# Otherwise connections live DB_CONN_MAX_AGE seconds (0 = one per request).
+# Either way they are health-checked before reuse.
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "django.db.backends.postgresql")
+DB_POOL = os.environ.get("DB_POOL", "0").lower() in ("1", "true", "yes")
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "em_auth_db",
-        "USER": "em_auth_user",
-        "PASSWORD": "1234",
-        "HOST": "localhost",
-        "PORT": "5432",
+        "ENGINE": DB_ENGINE,
+        "NAME": os.environ.get("DB_NAME", "em_auth_db"),
+        "USER": os.environ.get("DB_USER", "em_auth_user"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", "1234"),
+        "HOST": os.environ.get("DB_HOST", "localhost"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+if DB_POOL and DB_ENGINE == "django.db.backends.postgresql":
+    # the pool owns connection lifetime, Django must not keep its own
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", "300")),
+            # seconds to wait for a free connection before an error
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            # with CONN_HEALTH_CHECKS Django makes the pool ping a connection
+            # before handing it out
+        }
+    }
+
+# Read replicas: DB_REPLICAS=host1,host2:5433 (for SQLite: file names). Each becomes
+# an alias "replicaN" with the primary's settings and its own host/port (or NAME).
+DB_REPLICAS = [
+    r.strip() for r in os.environ.get("DB_REPLICAS", "").split(",") if r.strip()
+]
+for i, replica in enumerate(DB_REPLICAS, 1):
+    config = dict(DATABASES["default"])
+    if DB_ENGINE == "django.db.backends.sqlite3":
+        config["NAME"] = replica
+    else:
+        config["HOST"], _, port = replica.partition(":")
+        config["PORT"] = port or config["PORT"]
+    DATABASES[f"replica{i}"] = config
+
+DATABASE_ROUTERS = ["config.db_router.PrimaryReplicaRouter"]
+
+# GET requests read from a random replica; after a write the caller reads from
+# the primary for PIN_SECONDS (stored in CACHES[CACHE_ALIAS] — use a shared
+# cache when running several workers)
+DATABASE_REPLICAS = {
+    "ALIASES": [f"replica{i}" for i in range(1, len(DB_REPLICAS) + 1)],
+    "PIN_SECONDS": 5,
+    "CACHE_ALIAS": "default",
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,3 +192,96 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# RBAC
+# how often (seconds) each worker compares its in-memory rule matrix
+# with the version counter in the DB
+RBAC_VERSION_CHECK_SECONDS = 5
+
+# opt-in: embed role, is_active, per-element permission masks and the
+# permission epoch into access tokens, so authorization needs no DB at all
+# while the epoch is current
+JWT_EMBED_PERMISSIONS = False
+
+# cache of active users by id used on every authenticated request;
+# BACKEND "local" (per-process LRU) or "django" (CACHES[CACHE_ALIAS]).
+# Local invalidation only reaches the current worker, so keep TTL short
+USER_CACHE = {
+    "BACKEND": "local",
+    "MAX_SIZE": 10000,
+    "TTL": 30,
+    "CACHE_ALIAS": "default",
+}
+
+# bcrypt runs in a separate bounded process pool: at most POOL_SIZE hashes at
+# once and MAX_QUEUE waiting, the rest get 503 with Retry-After: RETRY_AFTER.
+# POOL_SIZE = 0 hashes inline on the request thread
+PASSWORD_HASHING = {
+    "POOL_SIZE": 2,
+    "MAX_QUEUE": 8,
+    "RETRY_AFTER": 1,
+}
+
+# sliding-window limits for /api/auth/login/ and /api/auth/register/,
+# checked per client IP and per email before any DB or bcrypt work.
+# BACKEND "local" (sharded in-process counters) or "django" (CACHES[CACHE_ALIAS])
+AUTH_THROTTLE = {
+    "BACKEND": "local",
+    "IP_RATE": "30/min",
+    "EMAIL_RATE": "10/min",
+    "SHARDS": 16,
+    "MAX_KEYS_PER_SHARD": 4096,
+    "CACHE_ALIAS": "default",
+}
+
+# access token lifetime; clients renew it via POST /api/auth/refresh/
+JWT_LIFETIME_MINUTES = 15
+# refresh tokens are rotated on every use
+JWT_REFRESH_LIFETIME_DAYS = 30
+
+# revoked access tokens (logout, deactivation): in-memory bloom filter of
+# revoked jti, rebuilt from the DB every REFRESH_SECONDS; the DB is only
+# asked when the filter says "maybe revoked". Expired rows are deleted by
+# a periodic `manage.py purge_revoked_tokens`
+TOKEN_REVOCATION = {
+    "BLOOM_CAPACITY": 100000,
+    "BLOOM_ERROR_RATE": 0.001,
+    "REFRESH_SECONDS": 30,
+}
+
+# verified access-token claims cached per token until its exp
+# (0 disables); dropped automatically when SECRET_KEY changes
+JWT_DECODE_CACHE_SIZE = 10000
+
+# keyset (cursor) pagination of GET /api/tasks/: default and max ?limit=
+KEYSET_PAGINATION = {
+    "PAGE_SIZE": 50,
+    "MAX_PAGE_SIZE": 500,
+}
+
+# GET /api/tasks/export/: rows fetched from the DB per round trip
+# (a server-side cursor on PostgreSQL)
+TASK_EXPORT_CHUNK_SIZE = 2000
+
+# POST /api/tasks/bulk/: max create + update + delete items per request
+TASK_BULK_MAX_ITEMS = 1000
+
+# POST /api/authz/batch/: max checks per request
+AUTHZ_BATCH_MAX_ITEMS = 1000
+
+# per-request query count / stage timings: Server-Timing header and
+# Prometheus histograms at GET /metrics
+METRICS_ENABLED = True
+# who may read GET /metrics: Authorization: Bearer <TOKEN> (Prometheus
+# `authorization` in scrape_config) or a client address in ALLOWED_IPS, resolved
+# with REST_FRAMEWORK["NUM_PROXIES"] like the throttles. Empty by default:
+# behind nginx on the same host every REMOTE_ADDR is 127.0.0.1
+METRICS_ACCESS = {
+    "TOKEN": os.environ.get("METRICS_TOKEN") or None,
+    "ALLOWED_IPS": [],
+}
+
+# token introspection for nginx auth_request / Envoy ext_authz,
+# served by config.introspect outside the Django middleware stack
+INTROSPECTION_PATH = "/api/auth/introspect/"
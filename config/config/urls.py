@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("users.urls")),
     path("api/", include("mockapp.urls")),
+    path("metrics", metrics_view),
 ]
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# token introspection for reverse proxies, outside the middleware stack;
+# imported after get_wsgi_application(), which sets Django up
+from config.introspect import mount_wsgi  # noqa: E402
+
+application = mount_wsgi(application)
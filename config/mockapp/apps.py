@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MockappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mockapp'
+
+    def ready(self):
+        from users.filters import register_element
+        from .models import Task
+
+        register_element("task", Task, owner_field="owner")
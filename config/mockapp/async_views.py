@@ -0,0 +1,128 @@
+from http import HTTPStatus
+from config.conditional import etag_matches, set_etag
+from mockapp.models import Task
+from mockapp.pagination import KeysetPagination
+from mockapp.serializers import TaskSerializer, task_etag
+from users.async_views import AsyncAPIView, PERMISSION_DENIED
+from users.filters import scoped
+from users.permissions import AccessRulePermission
+from users.principal import aget_principal, get_principal
+from users.rbac import METHOD_ACTIONS
+
+
+class AsyncTaskView(AsyncAPIView):
+    element_code = "task"  # use in AccessRulePermission
+    permission = AccessRulePermission()
+
+    async def dispatch(self, request, *args, **kwargs):
+        # principal and the rule matrix are resolved async once, after that
+        # AccessRulePermission works purely in memory
+        await (await aget_principal(request)).amatrix()
+        if not self.permission.has_permission(request, self):
+            return self.render(PERMISSION_DENIED, HTTPStatus.FORBIDDEN)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+# GET/POST /api/async/tasks/
+class AsyncTaskListCreateView(AsyncTaskView):
+    async def get(self, request):
+        principal = await aget_principal(request)
+        qs = scoped(principal, self.element_code)
+
+        paginator = KeysetPagination()
+        page = paginator.page_queryset(qs, request)
+        tasks = paginator.finish_page([task async for task in page])
+        data = TaskSerializer(tasks, many=True).data
+        return self.render(paginator.get_paginated_data(data))
+
+    async def post(self, request):
+        user = await (await aget_principal(request)).auser()
+        if user is None:
+            return self.render(
+                {"detail": "Authentication credentials were not provided."},
+                HTTPStatus.FORBIDDEN,
+            )
+
+        data, error = self.parse(request)
+        if error:
+            return error
+
+        serializer = TaskSerializer(data=data)
+        if not serializer.is_valid():
+            return self.render(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        task = await Task.objects.acreate(owner=user, **serializer.validated_data)
+        return self.render(TaskSerializer(task).data, HTTPStatus.CREATED)
+
+
+# GET/PATCH/DELETE /api/async/tasks/<pk>/
+class AsyncTaskDetailView(AsyncTaskView):
+    def get_queryset(self, request):
+        # same filter as AccessRuleFilterBackend: foreign tasks are a 404
+        action = METHOD_ACTIONS[request.method.upper()]
+        return scoped(get_principal(request), self.element_code, action)
+
+    async def get_object(self, request, pk):
+        task = await self.get_queryset(request).filter(pk=pk).afirst()
+        if task is None:
+            return None, self.render(
+                {"detail": "No Task matches the given query."}, HTTPStatus.NOT_FOUND
+            )
+        if not self.permission.has_object_permission(request, self, task):
+            return None, self.render(PERMISSION_DENIED, HTTPStatus.FORBIDDEN)
+        return task, None
+
+    async def get(self, request, pk):
+        if request.headers.get("If-None-Match"):
+            # same probe as the sync TaskDetailView
+            row = (
+                await self.get_queryset(request)
+                .filter(pk=pk)
+                .values_list("id", "owner_id", "updated_at")
+                .afirst()
+            )
+            if row is not None:
+                task_id, owner_id, updated_at = row
+                probe = Task(id=task_id, owner_id=owner_id)
+                if not self.permission.has_object_permission(request, self, probe):
+                    return self.render(PERMISSION_DENIED, HTTPStatus.FORBIDDEN)
+                etag = task_etag(task_id, owner_id, updated_at)
+                if etag_matches(request, etag):
+                    return set_etag(self.render(None, HTTPStatus.NOT_MODIFIED), etag)
+
+        task, error = await self.get_object(request, pk)
+        if error:
+            return error
+        return set_etag(
+            self.render(TaskSerializer(task).data),
+            task_etag(task.pk, task.owner_id, task.updated_at),
+        )
+
+    async def patch(self, request, pk):
+        task, error = await self.get_object(request, pk)
+        if error:
+            return error
+
+        data, error = self.parse(request)
+        if error:
+            return error
+
+        serializer = TaskSerializer(task, data=data, partial=True)
+        if not serializer.is_valid():
+            return self.render(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        for field, value in serializer.validated_data.items():
+            setattr(task, field, value)
+        await task.asave()
+        return set_etag(
+            self.render(TaskSerializer(task).data),
+            task_etag(task.pk, task.owner_id, task.updated_at),
+        )
+
+    async def delete(self, request, pk):
+        task, error = await self.get_object(request, pk)
+        if error:
+            return error
+
+        await task.adelete()
+        return self.render(None, HTTPStatus.NO_CONTENT)
@@ -0,0 +1,169 @@
+# Пакетные изменения задач: права считаются один раз на весь пакет,
+# владельцы всех затронутых задач читаются одним запросом,
+# изменения пишутся bulk_create / bulk_update / одним DELETE в одной транзакции.
+from http import HTTPStatus
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from mockapp.models import Task
+from mockapp.serializers import TaskSerializer
+from users.rbac import ALL_BITS, OWN_BITS
+
+
+def _result(status: int, task_id=None, **extra) -> dict:
+    return {"status": int(status), "id": task_id, **extra}
+
+
+def _parse_id(value):
+    # bool is an int too, but not a task id
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdecimal():
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_bulk_request(data, max_items: int):
+    if not isinstance(data, dict):
+        raise ValidationError({"detail": "Expected an object."})
+
+    sections = {}
+    for action in ("create", "update", "delete"):
+        items = data.get(action, [])
+        if not isinstance(items, list):
+            raise ValidationError({action: "Expected a list."})
+        sections[action] = items
+
+    total = sum(len(items) for items in sections.values())
+    if total > max_items:
+        raise ValidationError({"detail": f"At most {max_items} items per request."})
+    return sections
+
+
+def apply_bulk(principal, element_code: str, data, max_items: int) -> dict:
+    """
+    Применяет {"create": [...], "update": [{"id": ..., ...}], "delete": [id, ...]}
+    от имени principal и возвращает результат по каждому элементу в том же порядке.
+    Ошибка в одном элементе не отменяет остальные.
+    """
+    sections = parse_bulk_request(data, max_items)
+    mask = principal.get_mask(element_code)
+
+    def allowed(action: str, owner_id) -> bool:
+        if mask & ALL_BITS[action]:
+            return True
+        return bool(mask & OWN_BITS[action]) and owner_id == principal.user_id
+
+    results = {"create": [], "update": [], "delete": []}
+
+    # --- validation, no queries ---
+    to_create = []  # (result index, Task)
+    for item in sections["create"]:
+        if not mask & OWN_BITS["create"]:
+            results["create"].append(_result(HTTPStatus.FORBIDDEN))
+            continue
+        serializer = TaskSerializer(data=item)
+        if not serializer.is_valid():
+            results["create"].append(
+                _result(HTTPStatus.BAD_REQUEST, errors=serializer.errors)
+            )
+            continue
+        to_create.append(
+            (
+                len(results["create"]),
+                Task(owner_id=principal.user_id, **serializer.validated_data),
+            )
+        )
+        results["create"].append(None)
+
+    updates = []  # (task id, validated changes) or a ready result
+    for item in sections["update"]:
+        task_id = _parse_id(item.get("id")) if isinstance(item, dict) else None
+        if task_id is None:
+            updates.append(
+                _result(
+                    HTTPStatus.BAD_REQUEST, errors={"id": ["A task id is required."]}
+                )
+            )
+            continue
+        fields = {k: v for k, v in item.items() if k != "id"}
+        serializer = TaskSerializer(data=fields, partial=True)
+        if not serializer.is_valid():
+            updates.append(
+                _result(HTTPStatus.BAD_REQUEST, task_id, errors=serializer.errors)
+            )
+            continue
+        updates.append((task_id, serializer.validated_data))
+
+    delete_ids = [_parse_id(value) for value in sections["delete"]]
+
+    target_ids = {u[0] for u in updates if isinstance(u, tuple)}
+    target_ids.update(i for i in delete_ids if i is not None)
+
+    with transaction.atomic():
+        # --- one query for every target's owner ---
+        # rows stay locked until the writes, so nobody edits them in between
+        tasks = (
+            Task.objects.select_for_update().in_bulk(target_ids) if target_ids else {}
+        )
+
+        now = timezone.now()
+        changed = {}  # id -> (Task, changed fields), so a repeated id is written once
+        for update in updates:
+            if isinstance(update, dict):
+                results["update"].append(update)
+                continue
+            task_id, changes = update
+            task = tasks.get(task_id)
+            if task is None:
+                results["update"].append(_result(HTTPStatus.NOT_FOUND, task_id))
+            elif not allowed("update", task.owner_id):
+                results["update"].append(_result(HTTPStatus.FORBIDDEN, task_id))
+            else:
+                for name, value in changes.items():
+                    setattr(task, name, value)
+                # bulk_update does not run auto_now
+                task.updated_at = now
+                fields = changed[task_id][1] if task_id in changed else {"updated_at"}
+                fields.update(changes)
+                changed[task_id] = (task, fields)
+                results["update"].append(_result(HTTPStatus.OK, task_id))
+
+        deleted = set()
+        for task_id in delete_ids:
+            task = tasks.get(task_id)
+            if task_id is None:
+                results["delete"].append(
+                    _result(
+                        HTTPStatus.BAD_REQUEST,
+                        errors={"id": ["A task id is required."]},
+                    )
+                )
+            elif task is None:
+                results["delete"].append(_result(HTTPStatus.NOT_FOUND, task_id))
+            elif not allowed("delete", task.owner_id):
+                results["delete"].append(_result(HTTPStatus.FORBIDDEN, task_id))
+            else:
+                deleted.add(task_id)
+                results["delete"].append(_result(HTTPStatus.NO_CONTENT, task_id))
+
+        # --- writes ---
+        if to_create:
+            created = Task.objects.bulk_create([task for _, task in to_create])
+            for (index, _), task in zip(to_create, created):
+                results["create"][index] = _result(HTTPStatus.CREATED, task.pk)
+        # a task that is also deleted in this batch is not worth updating;
+        # one bulk_update per field set, so untouched columns are not rewritten
+        groups = {}
+        for pk, (task, fields) in changed.items():
+            if pk not in deleted:
+                groups.setdefault(frozenset(fields), []).append(task)
+        for fields, group in groups.items():
+            Task.objects.bulk_update(group, sorted(fields))
+        if deleted:
+            Task.objects.filter(id__in=deleted).delete()
+
+    return results
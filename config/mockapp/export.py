@@ -0,0 +1,52 @@
+# Потоковая выгрузка задач: строки читаются из БД пачками (server-side cursor
+# на Postgres) и сразу уходят клиенту, память не растёт с размером выгрузки.
+import csv
+import json
+from rest_framework import serializers
+from mockapp.serializers import TaskSerializer
+
+# same fields and order as TaskSerializer, "owner" is the owner's pk
+EXPORT_FIELDS = TaskSerializer.Meta.fields
+COLUMNS = ["owner_id" if name == "owner" else name for name in EXPORT_FIELDS]
+
+# the serializer's own datetime format, so the export matches the API output
+_datetime_field = serializers.DateTimeField()
+_DATETIME_FIELDS = [
+    i for i, name in enumerate(EXPORT_FIELDS) if name in ("created_at", "updated_at")
+]
+
+
+def export_rows(queryset, chunk_size: int):
+    """
+    Кортежи значений в порядке EXPORT_FIELDS, без создания моделей.
+    """
+    rows = queryset.order_by("id").values_list(*COLUMNS)
+    for row in rows.iterator(chunk_size=chunk_size):
+        row = list(row)
+        for i in _DATETIME_FIELDS:
+            row[i] = _datetime_field.to_representation(row[i])
+        yield row
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    # csv.writer wants a file; we want the formatted line back
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
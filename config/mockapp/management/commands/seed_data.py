@@ -0,0 +1,240 @@
+# Генератор больших объёмов данных для нагрузочных тестов.
+# Один заранее посчитанный bcrypt-хэш на всех пользователей, строки генерируются
+# пачками и пишутся COPY (PostgreSQL) или пакетными INSERT — без моделей и сигналов.
+import csv
+import io
+import itertools
+import random
+import secrets
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from mockapp.models import Task
+from users.models import AccessRule, BusinessElement, Role, User
+from users.rbac import bump_rbac_version
+from users.services import hash_password
+
+
+def zipf_cum_weights(n: int, skew: float):
+    # rank r gets weight 1 / r^skew; skew 0 = uniform
+    weights = (1 / (rank**skew) for rank in range(1, n + 1))
+    return list(itertools.accumulate(weights))
+
+
+class Command(BaseCommand):
+    help = "Generate roles, elements, access rules, users and tasks for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--tasks", type=int, default=100000)
+        parser.add_argument("--roles", type=int, default=20)
+        parser.add_argument("--elements", type=int, default=10)
+        parser.add_argument(
+            "--rule-density",
+            type=float,
+            default=1.0,
+            help="share of role × element cells that get a rule",
+        )
+        parser.add_argument(
+            "--owner-skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of task ownership (0 = uniform)",
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="spread created_at over N days"
+        )
+        parser.add_argument("--batch-size", type=int, default=50000)
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--no-copy", action="store_true", help="INSERT even on PostgreSQL"
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+        # unique per run, so the command can be run again on the same DB
+        # (not from the seeded rng: the same --seed would repeat it)
+        self.run_id = secrets.token_hex(4)
+        self.now = timezone.now()
+        self.days = options["days"]
+
+        started = time.monotonic()
+        role_ids = self.seed_roles(options["roles"])
+        self.seed_rules(role_ids, options["elements"], options["rule_density"])
+        user_ids = self.seed_users(options["users"], role_ids, options["password"])
+        self.seed_tasks(options["tasks"], user_ids, options["owner_skew"])
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                for model in (User, Task, AccessRule):
+                    cursor.execute(
+                        f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}"
+                    )
+        self.stdout.write(f"done in {time.monotonic() - started:.1f}s")
+
+    # --- small tables: plain bulk_create ---
+
+    def seed_roles(self, count: int) -> list:
+        names = [f"seed-{self.run_id}-role-{i}" for i in range(count)]
+        Role.objects.bulk_create([Role(name=name) for name in names])
+        ids = list(Role.objects.filter(name__in=names).values_list("id", flat=True))
+        self.stdout.write(f"roles: {len(ids)}")
+        return ids
+
+    def seed_rules(self, role_ids: list, element_count: int, density: float):
+        codes = [f"seed-{self.run_id}-element-{i}" for i in range(element_count)]
+        BusinessElement.objects.bulk_create(
+            [BusinessElement(code=code, name=code) for code in codes]
+        )
+        element_ids = list(
+            BusinessElement.objects.filter(code__in=codes).values_list("id", flat=True)
+        )
+        # seeded roles also get rules for the real "task" element
+        task_element, _ = BusinessElement.objects.get_or_create(
+            code="task", defaults={"name": "Task"}
+        )
+        element_ids.append(task_element.id)
+
+        rules = []
+        for role_id in role_ids:
+            for element_id in element_ids:
+                if self.rng.random() >= density:
+                    continue
+                rule = AccessRule(role_id=role_id, element_id=element_id)
+                # random flags, but every rule can at least read own objects
+                rule.mask = self.rng.getrandbits(len(AccessRule.FLAG_BITS))
+                rule.can_read = True
+                rules.append(rule)
+        with transaction.atomic():
+            AccessRule.objects.bulk_create(rules, batch_size=self.batch_size)
+            # bulk_create sends no signals
+            bump_rbac_version()
+        self.stdout.write(f"elements: {len(element_ids)}, rules: {len(rules)}")
+
+    # --- big tables: COPY / batched INSERT ---
+
+    def random_created_at(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.days * 86400)
+
+    def load(self, model, columns: list, rows, total: int):
+        table = connection.ops.quote_name(model._meta.db_table)
+        column_list = ", ".join(connection.ops.quote_name(c) for c in columns)
+        started = time.monotonic()
+        done = 0
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if self.use_copy:
+                    self.copy(cursor, table, column_list, batch)
+                else:
+                    self.insert(cursor, table, columns, column_list, batch)
+                done += len(batch)
+                rate = done / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"  {model._meta.model_name}: {done}/{total} ({rate:.0f} rows/s)"
+                )
+
+    @staticmethod
+    def copy(cursor, table, column_list, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        sql = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+        raw = cursor.cursor
+        if hasattr(raw, "copy_expert"):  # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+    @staticmethod
+    def insert(cursor, table, columns, column_list, batch):
+        # bulk_create would overwrite created_at (auto_now_add), so plain INSERT
+        adapt = connection.ops.adapt_datetimefield_value
+        datetime_columns = [
+            i for i, name in enumerate(columns) if name in ("created_at", "updated_at")
+        ]
+        if datetime_columns:
+            batch = [list(row) for row in batch]
+            for row in batch:
+                for i in datetime_columns:
+                    row[i] = adapt(row[i])
+        placeholders = ", ".join(["%s"] * len(columns))
+        cursor.executemany(
+            f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", batch
+        )
+
+    def seed_users(self, count: int, role_ids: list, password: str) -> list:
+        if not role_ids:
+            raise CommandError("--roles must be at least 1")
+        # one bcrypt hash for everybody instead of one per user
+        password_hash = hash_password(password)
+        max_id_before = (
+            User.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        )
+
+        def rows():
+            for i in range(count):
+                created_at = self.random_created_at()
+                yield (
+                    f"Seed User {i}",
+                    f"seed-{self.run_id}-{i}@example.com",
+                    password_hash,
+                    self.rng.choice(role_ids),
+                    True,
+                    created_at,
+                    created_at,
+                )
+
+        self.load(
+            User,
+            [
+                "full_name",
+                "email",
+                "password_hash",
+                "role_id",
+                "is_active",
+                "created_at",
+                "updated_at",
+            ],
+            rows(),
+            count,
+        )
+        return list(
+            User.objects.filter(id__gt=max_id_before).values_list("id", flat=True)
+        )
+
+    def seed_tasks(self, count: int, user_ids: list, skew: float):
+        if not count:
+            return
+        if not user_ids:
+            raise CommandError("tasks need users: --users must be at least 1")
+
+        # heavy owners are spread over the id range, not the first ids
+        owners = list(user_ids)
+        self.rng.shuffle(owners)
+        cum_weights = zipf_cum_weights(len(owners), skew)
+
+        def rows():
+            chunk = 10000
+            for start in range(0, count, chunk):
+                n = min(chunk, count - start)
+                picked = self.rng.choices(owners, cum_weights=cum_weights, k=n)
+                for i, owner_id in enumerate(picked, start):
+                    created_at = self.random_created_at()
+                    yield (f"Task {i}", "", owner_id, created_at, created_at)
+
+        self.load(
+            Task,
+            ["title", "description", "owner_id", "created_at", "updated_at"],
+            rows(),
+            count,
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mockapp", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="task_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["owner", "-created_at", "-id"], name="task_owner_created_id_idx"
+            ),
+        ),
+    ]
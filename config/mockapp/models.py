@@ -9,5 +9,14 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the task list: all tasks / own tasks
+            models.Index(fields=["-created_at", "-id"], name="task_created_id_idx"),
+            models.Index(
+                fields=["owner", "-created_at", "-id"], name="task_owner_created_id_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} (id={self.id})"
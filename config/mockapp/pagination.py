@@ -0,0 +1,108 @@
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (created_at, id), newest first.
+    Курсор — это последняя отданная строка, а не OFFSET, поэтому страница N
+    стоит столько же, сколько первая (индексы (created_at, id) и (owner, created_at, id)).
+
+    ?limit=<n> — размер страницы (не больше MAX_PAGE_SIZE), ?cursor=<...> — из поля next.
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    ordering = ("-created_at", "-id")
+
+    def __init__(self):
+        config = {
+            "PAGE_SIZE": 50,
+            "MAX_PAGE_SIZE": 500,
+            **getattr(settings, "KEYSET_PAGINATION", {}),
+        }
+        self.page_size = config["PAGE_SIZE"]
+        self.max_page_size = config["MAX_PAGE_SIZE"]
+        self.next_cursor = None
+        self.request = None
+
+    @staticmethod
+    def encode_cursor(created_at: datetime, pk: int) -> str:
+        raw = f"{created_at.isoformat()}|{pk}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            created_at, pk = raw.split("|")
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.GET[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def page_queryset(self, queryset, request):
+        """
+        Lazy queryset for one page (+1 row to know whether there is a next one).
+        Split from paginate_queryset so async views can evaluate it themselves.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            # (created_at, id) < (cursor): written so that the created_at part
+            # is a plain range condition on the index
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at)
+                & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+            )
+        return queryset[: self.limit + 1]
+
+    def finish_page(self, rows) -> list:
+        rows = list(rows)
+        self.next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[: self.limit]
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor(last.created_at, last.pk)
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(self.page_queryset(queryset, request))
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data) -> dict:
+        return {"next": self.get_next_link(), "results": data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -1,9 +1,23 @@
 from rest_framework import serializers
+from config.conditional import make_etag
+from config.serializers import (
+    FastRepresentationMixin,
+    TimedDataMixin,
+    TimedListSerializer,
+)
 from .models import Task
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(
+    TimedDataMixin, FastRepresentationMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Task
+        list_serializer_class = TimedListSerializer
         fields = ["id", "title", "description", "owner", "created_at", "updated_at"]
         read_only_fields = ["id", "owner", "created_at", "updated_at"]
+
+
+def task_etag(task_id: int, owner_id: int, updated_at) -> str:
+    # the same parts are available from a values_list() probe
+    return make_etag("task", task_id, owner_id, updated_at.isoformat())
@@ -1,3 +1,379 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from mockapp.models import Task
+from mockapp.pagination import KeysetPagination
+from users.models import AccessRule, BusinessElement, Role, User
+from users.services import create_access_token
+from users.tests import SEQ_SCAN, explain, reset_caches
 
-# Create your tests here.
+
+class TaskQueryPlanTests(TestCase):
+    def page(self, queryset):
+        return queryset.order_by(*KeysetPagination.ordering)[:51]
+
+    def test_own_task_list_uses_owner_index(self):
+        plan = explain(self.page(Task.objects.filter(owner_id=1)))
+        self.assertIn("task_owner_created_id_idx", plan)
+
+    def test_all_task_list_uses_created_index(self):
+        plan = explain(self.page(Task.objects.all()))
+        self.assertIn("task_created_id_idx", plan)
+
+    def test_detail_lookup_is_indexed(self):
+        plan = explain(Task.objects.filter(pk=1))
+        self.assertNotRegex(plan, SEQ_SCAN)
+
+
+class TaskQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(
+            role=role, element=element, can_read=True, can_update=True
+        )
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        cls.tasks = Task.objects.bulk_create(
+            [Task(title=f"t{i}", owner=cls.user) for i in range(30)]
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+        # first request loads the user and the rule matrix
+        self.client.get("/api/tasks/?limit=1", **self.auth)
+
+    def test_list_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/tasks/?limit=10", **self.auth)
+        self.assertEqual(len(response.json()["results"]), 10)
+
+        with self.assertNumQueries(1):
+            self.client.get(response.json()["next"], **self.auth)
+
+    def test_detail_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/tasks/{self.tasks[0].pk}/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_detail_is_one_probe(self):
+        path = f"/api/tasks/{self.tasks[0].pk}/"
+        etag = self.client.get(path, **self.auth)["ETag"]
+
+        # values_list probe only: the task is neither loaded nor serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.patch(
+            path, {"title": "new"}, content_type="application/json", **self.auth
+        )
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "new")
+
+    def test_foreign_task_is_not_loaded(self):
+        other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=self.user.role
+        )
+        foreign = Task.objects.create(title="foreign", owner=other)
+
+        # filtered out by owner_id in the same query: 404, not a loaded row + 403
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/tasks/{foreign.pk}/", **self.auth)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.patch(
+            f"/api/tasks/{foreign.pk}/",
+            {"title": "x"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/api/tasks/?limit=100", **self.auth)
+        ids = {task["id"] for task in response.json()["results"]}
+        self.assertEqual(ids, {task.pk for task in self.tasks})
+
+    def test_export_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/tasks/export/", **self.auth)
+            lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 30)
+
+    def test_bulk_update_does_not_grow_with_batch_size(self):
+        body = {"update": [{"id": task.pk, "title": "x"} for task in self.tasks]}
+        # one SELECT ... FOR UPDATE and one UPDATE, both inside a transaction
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                "/api/tasks/bulk/", body, content_type="application/json", **self.auth
+            )
+        self.assertTrue(all(r["status"] == 200 for r in response.json()["update"]))
+
+
+class TaskListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(role=role, element=element, can_read=True)
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=role
+        )
+        cls.tasks = Task.objects.bulk_create(
+            [Task(title=f"t{i}", owner=cls.user) for i in range(20)]
+        )
+        Task.objects.create(title="foreign", owner=other)
+        # ties on created_at are broken by id
+        now = timezone.now()
+        for i, task in enumerate(cls.tasks):
+            Task.objects.filter(pk=task.pk).update(
+                created_at=now - timedelta(seconds=i // 5)
+            )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def walk(self, path):
+        ids = []
+        while path:
+            response = self.client.get(path, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids += [task["id"] for task in page["results"]]
+            path = page["next"]
+        return ids
+
+    def test_pages_cover_own_tasks_once(self):
+        expected = [
+            task.pk
+            for task in sorted(
+                Task.objects.filter(owner=self.user),
+                key=lambda t: (t.created_at, t.pk),
+                reverse=True,
+            )
+        ]
+        for path in ("/api/tasks/?limit=7", "/api/async/tasks/?limit=7"):
+            self.assertEqual(self.walk(path), expected)
+
+    def test_page_n_costs_one_query(self):
+        response = self.client.get("/api/tasks/?limit=3", **self.auth)
+        path = response.json()["next"]
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                path = self.client.get(path, **self.auth).json()["next"]
+
+    def test_limit_and_bad_cursor(self):
+        with self.settings(KEYSET_PAGINATION={"PAGE_SIZE": 2, "MAX_PAGE_SIZE": 5}):
+            response = self.client.get("/api/tasks/", **self.auth)
+            self.assertEqual(len(response.json()["results"]), 2)
+            response = self.client.get("/api/tasks/?limit=100", **self.auth)
+            self.assertEqual(len(response.json()["results"]), 5)
+
+        response = self.client.get("/api/tasks/?cursor=nope", **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_matches_api(self):
+        response = self.client.get("/api/tasks/export/", **self.auth)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        # own tasks only, in id order, same fields as the API
+        api = self.client.get(f"/api/tasks/{self.tasks[0].pk}/", **self.auth).json()
+        self.assertEqual(rows[0], api)
+        self.assertEqual([row["id"] for row in rows], [task.pk for task in self.tasks])
+
+        response = self.client.get("/api/tasks/export/?fmt=csv", **self.auth)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        header, *rows = csv.reader(lines)
+        self.assertEqual(header, list(api))
+        self.assertEqual(len(rows), len(self.tasks))
+
+        response = self.client.get("/api/tasks/export/?fmt=xml", **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(
+            role=role,
+            element=element,
+            can_read=True,
+            can_create=True,
+            can_update=True,
+            can_delete=True,
+        )
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=role
+        )
+        cls.own = Task.objects.create(title="own", owner=cls.user)
+        cls.gone = Task.objects.create(title="gone", owner=cls.user)
+        cls.foreign = Task.objects.create(title="foreign", owner=other)
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def bulk(self, body):
+        return self.client.post(
+            "/api/tasks/bulk/", body, content_type="application/json", **self.auth
+        )
+
+    def statuses(self, results):
+        return [item["status"] for item in results]
+
+    def test_per_item_results(self):
+        response = self.bulk(
+            {
+                "create": [{"title": "new"}, {"title": ""}],
+                "update": [
+                    {"id": self.own.pk, "title": "renamed"},
+                    {"id": str(self.foreign.pk), "title": "x"},
+                    {"id": 10**6, "title": "x"},
+                    {"title": "no id"},
+                ],
+                "delete": [self.gone.pk, self.foreign.pk, "x"],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(self.statuses(results["create"]), [201, 400])
+        self.assertEqual(self.statuses(results["update"]), [200, 403, 404, 400])
+        self.assertEqual(self.statuses(results["delete"]), [204, 403, 400])
+
+        created = Task.objects.get(pk=results["create"][0]["id"])
+        self.assertEqual((created.title, created.owner_id), ("new", self.user.pk))
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.title, "renamed")
+        self.assertGreater(self.own.updated_at, self.own.created_at)
+        self.assertFalse(Task.objects.filter(pk=self.gone.pk).exists())
+        self.assertEqual(Task.objects.get(pk=self.foreign.pk).title, "foreign")
+
+    def test_non_ascii_digit_id(self):
+        response = self.bulk({"update": [{"id": "²", "title": "x"}], "delete": ["²"]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(self.statuses(results["update"]), [400])
+        self.assertEqual(self.statuses(results["delete"]), [400])
+        self.assertEqual(
+            results["delete"][0]["errors"], {"id": ["A task id is required."]}
+        )
+
+    def test_update_writes_only_changed_fields(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.bulk(
+                {
+                    "update": [
+                        {"id": self.own.pk, "title": "renamed"},
+                        {"id": self.gone.pk, "description": "text"},
+                    ]
+                }
+            )
+        self.assertEqual(self.statuses(response.json()["update"]), [200, 200])
+        updates = [q["sql"] for q in ctx if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        # one field set per UPDATE: a title edit does not rewrite description
+        for sql in updates:
+            self.assertFalse('"title"' in sql and '"description"' in sql, sql)
+        self.own.refresh_from_db()
+        self.gone.refresh_from_db()
+        self.assertEqual((self.own.title, self.gone.description), ("renamed", "text"))
+
+    def test_limits(self):
+        with self.settings(TASK_BULK_MAX_ITEMS=2):
+            response = self.bulk({"delete": [1, 2, 3]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.bulk({"update": {}}).status_code, 400)
+
+        self.auth = {}
+        self.assertEqual(self.bulk({"delete": [self.own.pk]}).status_code, 403)
+
+
+# version check on every call: a sync matrix load inside the async views
+# would raise SynchronousOnlyOperation
+@override_settings(RBAC_VERSION_CHECK_SECONDS=0)
+class AsyncTaskViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(
+            role=role,
+            element=element,
+            can_read=True,
+            can_create=True,
+            can_update=True,
+            can_delete=True,
+        )
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=role
+        )
+        cls.task = Task.objects.create(title="mine", owner=cls.user)
+        cls.foreign = Task.objects.create(title="foreign", owner=other)
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def test_list_and_create(self):
+        response = self.client.get("/api/async/tasks/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["id"] for t in response.json()["results"]], [self.task.pk])
+
+        response = self.client.post(
+            "/api/async/tasks/",
+            {"title": "new"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["owner"], self.user.pk)
+
+        self.assertEqual(self.client.get("/api/async/tasks/").status_code, 403)
+
+    def test_detail(self):
+        path = f"/api/async/tasks/{self.task.pk}/"
+        response = self.client.get(path, **self.auth)
+        self.assertEqual(response.json()["title"], "mine")
+
+        response = self.client.patch(
+            path, {"title": "new"}, content_type="application/json", **self.auth
+        )
+        self.assertEqual(response.json()["title"], "new")
+        self.assertEqual(self.client.delete(path, **self.auth).status_code, 204)
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+
+        response = self.client.get(f"/api/async/tasks/{self.foreign.pk}/", **self.auth)
+        self.assertEqual(response.status_code, 404)
@@ -1,7 +1,18 @@
 from django.urls import path
-from .views import TaskListCreateView, TaskDetailView
+from .async_views import AsyncTaskDetailView, AsyncTaskListCreateView
+from .views import (
+    TaskBulkView,
+    TaskDetailView,
+    TaskExportView,
+    TaskListCreateView,
+)
 
 urlpatterns = [
     path("tasks/", TaskListCreateView.as_view()),
     path("tasks/<int:pk>/", TaskDetailView.as_view()),
+    path("tasks/export/", TaskExportView.as_view()),
+    path("tasks/bulk/", TaskBulkView.as_view()),
+    # async (ASGI) variants
+    path("async/tasks/", AsyncTaskListCreateView.as_view()),
+    path("async/tasks/<int:pk>/", AsyncTaskDetailView.as_view()),
 ]
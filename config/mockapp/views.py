@@ -1,10 +1,20 @@
-from rest_framework.exceptions import PermissionDenied
+from http import HTTPStatus
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from config.conditional import etag_matches, set_etag
+from mockapp.bulk import apply_bulk
+from mockapp.export import EXPORT_FORMATS, export_rows
 from mockapp.models import Task
-from mockapp.serializers import TaskSerializer
-from users.models import User
-from users.permissions import AccessRulePermission
-from users.services import get_user_from_request
+from mockapp.pagination import KeysetPagination
+from mockapp.serializers import TaskSerializer, task_etag
+from users.filters import AccessRuleFilterBackend, scoped
+from users.permissions import AccessRulePermission, BulkAccessRulePermission
+from users.principal import get_principal
+
 
 # Две простые ручки:
 
@@ -12,38 +22,17 @@ from users.services import get_user_from_request
 class TaskListCreateView(ListCreateAPIView):
     serializer_class = TaskSerializer
     permission_classes = [AccessRulePermission]
-    element_code = "task"  # use in AccessRulePermission
-
-    def get_queryset(self):
-        # get current user
-        user = get_user_from_request(self.request)
-
-        if not isinstance(user, User) or not user.is_active:
-            return Task.objects.none()
-
-        # try to get access rule for this user
-        # берём правило доступа тем же способом, что и в permissions
-        perm = AccessRulePermission()
-        rule = perm._get_rule(user, self)
-        if not rule:
-            return Task.objects.none()
-
-        qs = Task.objects.select_related("owner")
-
-        # если роль может читать все задачи — отдаём всё
-        if rule.can_read_all:
-            return qs
-
-        # иначе — только собственные задачи
-        return qs.filter(owner=user)
+    # только задачи, которые роль может читать: все (READ_ALL) или свои (READ)
+    filter_backends = [AccessRuleFilterBackend]
+    pagination_class = KeysetPagination
+    element_code = "task"  # use in AccessRulePermission and AccessRuleFilterBackend
+    # owner is rendered as a pk, no need to join users
+    queryset = Task.objects.all()
 
     def perform_create(self, serializer):
-        django_request = getattr(self.request, "_request", self.request)
-
-        # пробуем взять пользователя из api_user (куда кладёт JWT-middleware),
-        user = getattr(django_request, "api_user", None)
+        user = get_principal(self.request).user
 
-        if not isinstance(user, User) or not user.is_active:
+        if user is None:
             raise PermissionDenied("Authentication credentials were not provided.")
 
         serializer.save(owner=user)
@@ -52,5 +41,81 @@ class TaskListCreateView(ListCreateAPIView):
 class TaskDetailView(RetrieveUpdateDestroyAPIView):
     serializer_class = TaskSerializer
     permission_classes = [AccessRulePermission]
+    # a task the rule doesn't cover for this method is a 404, not a 403
+    filter_backends = [AccessRuleFilterBackend]
     element_code = "task"
     queryset = Task.objects.all()
+
+    def get_object(self):
+        # kept for the ETag of the update response
+        self.task = super().get_object()
+        return self.task
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.headers.get("If-None-Match"):
+            # conditional GET: permission and ETag from three columns,
+            # the row is loaded and serialized only if it has changed
+            row = (
+                self.filter_queryset(self.get_queryset())
+                .filter(pk=kwargs["pk"])
+                .values_list("id", "owner_id", "updated_at")
+                .first()
+            )
+            if row is not None:
+                task_id, owner_id, updated_at = row
+                self.check_object_permissions(
+                    request, Task(id=task_id, owner_id=owner_id)
+                )
+                etag = task_etag(task_id, owner_id, updated_at)
+                if etag_matches(request, etag):
+                    return set_etag(Response(status=HTTPStatus.NOT_MODIFIED), etag)
+
+        response = super().retrieve(request, *args, **kwargs)
+        return set_etag(
+            response, task_etag(self.task.pk, self.task.owner_id, self.task.updated_at)
+        )
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        return set_etag(
+            response, task_etag(self.task.pk, self.task.owner_id, self.task.updated_at)
+        )
+
+
+# GET /api/tasks/export/?fmt=ndjson|csv — все видимые задачи одним потоком
+class TaskExportView(APIView):
+    permission_classes = [AccessRulePermission]
+    element_code = "task"
+    # not "format": DRF reserves it for renderer selection
+    format_query_param = "fmt"
+
+    def get(self, request):
+        fmt = request.GET.get(self.format_query_param, "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError(
+                {
+                    self.format_query_param: f"Expected one of: {', '.join(EXPORT_FORMATS)}."
+                }
+            )
+        lines, content_type = EXPORT_FORMATS[fmt]
+
+        qs = scoped(get_principal(request), self.element_code)
+        chunk_size = getattr(settings, "TASK_EXPORT_CHUNK_SIZE", 2000)
+        response = StreamingHttpResponse(
+            lines(export_rows(qs, chunk_size)), content_type=content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="tasks.{fmt}"'
+        return response
+
+
+# POST /api/tasks/bulk/ — {"create": [...], "update": [...], "delete": [...]}
+class TaskBulkView(APIView):
+    permission_classes = [BulkAccessRulePermission]
+    element_code = "task"
+
+    def post(self, request):
+        max_items = getattr(settings, "TASK_BULK_MAX_ITEMS", 1000)
+        results = apply_bulk(
+            get_principal(request), self.element_code, request.data, max_items
+        )
+        return Response(results)
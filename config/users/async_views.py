@@ -0,0 +1,167 @@
+# Async-варианты горячих ручек для запуска под ASGI (uvicorn и т.п.):
+# async ORM вместо потоков, bcrypt — в executor, ответы байт-в-байт как у DRF.
+import json
+from http import HTTPStatus
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+from config.conditional import etag_matches, set_etag
+from config.renderers import OrjsonRenderer
+from .cache import aget_fresh_user
+from .models import User
+from .principal import aget_principal
+from .rbac import aget_rule_matrix
+from .serializers import (
+    LoginFieldsSerializer,
+    MeUpdateSerializer,
+    UserSerializer,
+    user_etag,
+)
+from .hashing import HashingBusy
+from .revocation import revoke_access_token
+from .services import averify_password
+from .throttling import check_auth_throttle
+from .tokens import aissue_token_pair
+
+NOT_AUTHENTICATED = {"detail": "Authentication credentials were not provided."}
+PERMISSION_DENIED = {"detail": "You do not have permission to perform this action."}
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    """
+    Base for async JSON views: same renderer as DRF, so responses are identical.
+    """
+
+    renderer = OrjsonRenderer()
+
+    def render(self, data, status=HTTPStatus.OK):
+        content = self.renderer.render(data) if data is not None else b""
+        return HttpResponse(content, status=status, content_type="application/json")
+
+    def parse(self, request):
+        # returns (data, None) or (None, error response)
+        if not request.body:
+            return {}, None
+        try:
+            return json.loads(request.body), None
+        except ValueError as e:
+            return None, self.render(
+                {"detail": f"JSON parse error - {e}"}, HTTPStatus.BAD_REQUEST
+            )
+
+
+# POST /api/async/auth/login/
+class AsyncLoginView(AsyncAPIView):
+    def invalid(self, message):
+        return self.render({"non_field_errors": [message]}, HTTPStatus.BAD_REQUEST)
+
+    async def post(self, request):
+        data, error = self.parse(request)
+        if error:
+            return error
+
+        # same limits as the sync LoginView, before any DB or bcrypt work
+        email = data.get("email") if isinstance(data, dict) else None
+        ip = BaseThrottle().get_ident(request)
+        wait = check_auth_throttle("login", ip, email)
+        if wait is not None:
+            throttled = Throttled(wait)
+            response = self.render(
+                {"detail": throttled.detail}, HTTPStatus.TOO_MANY_REQUESTS
+            )
+            response["Retry-After"] = "%d" % throttled.wait
+            return response
+
+        serializer = LoginFieldsSerializer(data=data)
+        if not serializer.is_valid():
+            return self.render(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        email = serializer.validated_data["email"].lower()
+        password = serializer.validated_data["password"]
+
+        user = (
+            await User.objects.select_related("role")
+            .filter(email__lower=email)
+            .afirst()
+        )
+        if user is None:
+            return self.invalid("Invalid email or password")
+        if not user.is_active:
+            return self.invalid("User is inactive")
+
+        # bcrypt is CPU-bound: it goes to the hashing pool, off the event loop
+        try:
+            valid = await averify_password(password, user.password_hash)
+        except HashingBusy as e:
+            response = self.render({"detail": e.detail}, e.status_code)
+            response["Retry-After"] = str(e.wait)
+            return response
+        if not valid:
+            return self.invalid("Invalid email or password")
+
+        data = {
+            **await aissue_token_pair(user, await aget_rule_matrix()),
+            "token_type": "Bearer",
+            "user": UserSerializer(user).data,
+        }
+        return self.render(data)
+
+
+# GET/PATCH/DELETE /api/async/me/
+class AsyncMeView(AsyncAPIView):
+    async def get_user_for_update(self, request):
+        # same as MeView: writes start from the current row, not the cached copy
+        user_id = (await aget_principal(request)).user_id
+        return await aget_fresh_user(user_id) if user_id is not None else None
+
+    async def get(self, request):
+        user = await (await aget_principal(request)).auser()
+        if user is None:
+            return self.render(NOT_AUTHENTICATED, HTTPStatus.UNAUTHORIZED)
+        etag = user_etag(user)
+        if etag_matches(request, etag):
+            return set_etag(self.render(None, HTTPStatus.NOT_MODIFIED), etag)
+        return set_etag(self.render(UserSerializer(user).data), etag)
+
+    async def patch(self, request):
+        user = await self.get_user_for_update(request)
+        if user is None:
+            return self.render(NOT_AUTHENTICATED, HTTPStatus.UNAUTHORIZED)
+
+        data, error = self.parse(request)
+        if error:
+            return error
+
+        serializer = MeUpdateSerializer(
+            data=data,
+            context={"user": user},
+            partial=True,
+        )
+        # email uniqueness check is a sync query; writes are rare enough
+        if not await sync_to_async(serializer.is_valid)():
+            return self.render(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        data = serializer.validated_data
+        fields = [field for field in ("full_name", "email") if field in data]
+        for field in fields:
+            setattr(user, field, data[field])
+
+        await user.asave(update_fields=[*fields, "updated_at"])
+        return set_etag(self.render(UserSerializer(user).data), user_etag(user))
+
+    # мягкое удаление
+    async def delete(self, request):
+        user = await self.get_user_for_update(request)
+        if user is None:
+            return self.render(NOT_AUTHENTICATED, HTTPStatus.UNAUTHORIZED)
+
+        user.is_active = False
+        # refresh tokens are revoked by the users.signals
+        await user.asave(update_fields=["is_active", "updated_at"])
+        await sync_to_async(revoke_access_token)((await aget_principal(request)).claims)
+        return self.render(None, HTTPStatus.NO_CONTENT)
@@ -0,0 +1,144 @@
+# Пакетные решения о доступе: «может ли вызывающий сделать action над
+# элементом / объектом» для целой страницы проверок за раз.
+# Правила — из маски principal (в памяти), владельцы объектов — одним
+# UNION ALL-запросом по всем зарегистрированным моделям (users.filters).
+from typing import Iterable, Optional
+from django.db.models import CharField, Value
+from rest_framework.exceptions import ValidationError
+from .filters import get_element_scope
+from .principal import Principal
+from .rbac import ALL_BITS, OWN_BITS
+
+ACTIONS = tuple(OWN_BITS)
+
+
+class Check:
+    __slots__ = ("element_code", "action", "owner_id", "object_id")
+
+    def __init__(
+        self,
+        element_code: str,
+        action: str,
+        owner_id: Optional[int] = None,
+        object_id: Optional[int] = None,
+    ):
+        self.element_code = element_code
+        self.action = action
+        self.owner_id = owner_id
+        self.object_id = object_id
+
+
+def _parse_int(value):
+    # bool is an int too, but not an id
+    if value is None or (isinstance(value, int) and not isinstance(value, bool)):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    raise ValueError
+
+
+def parse_checks(data, max_items: int) -> list[Check]:
+    """
+    {"checks": [{"element": "task", "action": "update", "object_id": 5}, ...]}
+    -> [Check]; ValidationError with the index of the first bad item.
+    """
+    items = data.get("checks") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValidationError({"checks": "Expected a list."})
+    if len(items) > max_items:
+        raise ValidationError({"checks": f"At most {max_items} items per request."})
+
+    checks = []
+    for index, item in enumerate(items):
+        element = item.get("element") if isinstance(item, dict) else None
+        action = item.get("action") if isinstance(item, dict) else None
+        if not isinstance(element, str) or not element or action not in ACTIONS:
+            expected = f"Expected element and action (one of: {', '.join(ACTIONS)})."
+            raise ValidationError({"checks": {index: expected}})
+        try:
+            owner_id = _parse_int(item.get("owner_id"))
+            object_id = _parse_int(item.get("object_id"))
+        except ValueError:
+            raise ValidationError({"checks": {index: "Ids must be integers."}})
+        if owner_id is not None and object_id is not None:
+            raise ValidationError(
+                {"checks": {index: "Give owner_id or object_id, not both."}}
+            )
+        checks.append(Check(element, action, owner_id, object_id))
+    return checks
+
+
+def load_owners(object_ids: dict[str, set]) -> dict[tuple[str, int], int]:
+    """
+    {element_code: {object id, ...}} -> {(element_code, object id): owner id}
+    одним запросом на все элементы. Незарегистрированные элементы пропускаются.
+    """
+    queries = []
+    for code, ids in object_ids.items():
+        try:
+            scope = get_element_scope(code)
+        except LookupError:
+            continue
+        queries.append(
+            scope.model._default_manager.filter(pk__in=ids)
+            .annotate(authz_element=Value(code, output_field=CharField()))
+            .values_list("authz_element", "pk", scope.owner_field)
+            .order_by()
+        )
+    if not queries:
+        return {}
+
+    first, *rest = queries
+    rows = first.union(*rest, all=True) if rest else first
+    return {(code, pk): owner_id for code, pk, owner_id in rows}
+
+
+def authorize_many(principal: Principal, checks: Iterable) -> list[bool]:
+    """
+    Решение по каждой проверке, в том же порядке. Проверка — Check или кортеж
+    (element_code, action[, owner_id[, object_id]]):
+
+    - без owner_id/object_id — право на элемент вообще (как has_permission);
+    - с owner_id — на объект этого владельца (как has_object_permission);
+    - с object_id — то же, владелец читается из БД; несуществующий объект — False.
+
+    Владельцы объектов по object_id читаются одним запросом на весь пакет.
+    """
+    checks = [c if isinstance(c, Check) else Check(*c) for c in checks]
+    masks = {}  # element_code -> mask
+    user_id = principal.user_id
+
+    decisions: list[Optional[bool]] = []
+    pending = {}  # element_code -> object ids whose owner decides
+    for check in checks:
+        mask = masks.get(check.element_code)
+        if mask is None:
+            mask = masks[check.element_code] = principal.get_mask(check.element_code)
+
+        any_owner = mask & ALL_BITS[check.action]
+        own = mask & OWN_BITS[check.action]
+        if not any_owner and (not own or user_id is None):
+            decisions.append(False)
+        elif check.object_id is not None:
+            # даже с *_all объект должен существовать
+            pending.setdefault(check.element_code, set()).add(check.object_id)
+            decisions.append(None)
+        elif any_owner:
+            decisions.append(True)
+        elif check.owner_id is not None:
+            decisions.append(check.owner_id == user_id)
+        else:
+            decisions.append(True)
+
+    if pending:
+        owners = load_owners(pending)
+        for index, check in enumerate(checks):
+            if decisions[index] is None:
+                key = (check.element_code, check.object_id)
+                if key not in owners:
+                    decisions[index] = False
+                elif masks[check.element_code] & ALL_BITS[check.action]:
+                    decisions[index] = True
+                else:
+                    decisions[index] = owners[key] == user_id
+    return decisions
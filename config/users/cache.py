@@ -0,0 +1,260 @@
+# Кэш пользователей по id: горячие сервисные аккаунты дёргаются тысячи раз в минуту,
+# и каждый раз ходить в БД за одной и той же строкой незачем.
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .models import User
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU with a per-entry TTL and hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LocalUserCache:
+    """
+    Process-local backend. Invalidation reaches only this worker, so other
+    workers may serve a stale user for at most TTL seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float, **options):
+        self._lru = LRUCache(max_size, ttl)
+
+    def get(self, user_id: int) -> Optional[User]:
+        user = self._lru.get(user_id)
+        # callers may modify and save the user, never hand out the shared instance
+        return copy.copy(user) if user is not None else None
+
+    def set(self, user: User):
+        self._lru.set(user.id, copy.copy(user))
+
+    def delete(self, user_id: int):
+        self._lru.delete(user_id)
+
+    def clear(self):
+        self._lru.clear()
+
+    def stats(self) -> dict:
+        return self._lru.stats()
+
+    # in-memory, nothing to await
+    async def aget(self, user_id: int) -> Optional[User]:
+        return self.get(user_id)
+
+    async def aset(self, user: User):
+        self.set(user)
+
+
+class DjangoUserCache:
+    """
+    Backend on top of Django's cache framework (CACHES[alias]), shared between
+    workers when the cache itself is shared (Redis, Memcached).
+    Evictions are up to the cache server and are not counted here.
+    """
+
+    def __init__(self, max_size: int, ttl: float, alias: str = "default", **options):
+        self.ttl = ttl
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _generation(self):
+        # clear() bumps the generation instead of deleting every key
+        return self._cache.get_or_set("users:user:gen", 0, None)
+
+    def _key(self, user_id: int):
+        return f"users:user:{self._generation()}:{user_id}"
+
+    def get(self, user_id: int) -> Optional[User]:
+        user = self._cache.get(self._key(user_id))
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    def set(self, user: User):
+        self._cache.set(self._key(user.id), user, self.ttl)
+
+    async def aget(self, user_id: int) -> Optional[User]:
+        gen = await self._cache.aget_or_set("users:user:gen", 0, None)
+        user = await self._cache.aget(f"users:user:{gen}:{user_id}")
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    async def aset(self, user: User):
+        gen = await self._cache.aget_or_set("users:user:gen", 0, None)
+        await self._cache.aset(f"users:user:{gen}:{user.id}", user, self.ttl)
+
+    def delete(self, user_id: int):
+        self._cache.delete(self._key(user_id))
+
+    def clear(self):
+        try:
+            self._cache.incr("users:user:gen")
+        except ValueError:
+            self._cache.set("users:user:gen", 1, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": 0,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+USER_CACHE_BACKENDS = {
+    "local": LocalUserCache,
+    "django": DjangoUserCache,
+}
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = {
+                    "BACKEND": "local",
+                    "MAX_SIZE": 10000,
+                    "TTL": 30,
+                    **getattr(settings, "USER_CACHE", {}),
+                }
+                backend = USER_CACHE_BACKENDS[config["BACKEND"]]
+                _user_cache = backend(
+                    max_size=config["MAX_SIZE"],
+                    ttl=config["TTL"],
+                    alias=config.get("CACHE_ALIAS", "default"),
+                )
+    return _user_cache
+
+
+def _active_user(user_id: int):
+    return User.objects.select_related("role").filter(id=user_id, is_active=True)
+
+
+def get_fresh_user(user_id: int) -> Optional[User]:
+    """
+    Active user straight from the DB. For writes: a cached copy can be up to
+    TTL old, and saving it would put back a stale role or status.
+    """
+    return _active_user(user_id).first()
+
+
+async def aget_fresh_user(user_id: int) -> Optional[User]:
+    return await _active_user(user_id).afirst()
+
+
+def get_cached_user(user_id: int) -> Optional[User]:
+    """
+    Active user (with role joined) by id, через кэш.
+    """
+    cache = get_user_cache()
+    user = cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = get_fresh_user(user_id)
+    if user is not None:
+        cache.set(user)
+    return user
+
+
+async def aget_cached_user(user_id: int) -> Optional[User]:
+    cache = get_user_cache()
+    user = await cache.aget(user_id)
+    if user is not None:
+        return user
+
+    user = await aget_fresh_user(user_id)
+    if user is not None:
+        await cache.aset(user)
+    return user
+
+
+def invalidate_user(user_id: int):
+    cache = get_user_cache()
+    cache.delete(user_id)
+    # and after commit, in case a concurrent request re-cached the old row
+    transaction.on_commit(lambda: cache.delete(user_id))
+
+
+def invalidate_all_users():
+    cache = get_user_cache()
+    cache.clear()
+    transaction.on_commit(cache.clear)
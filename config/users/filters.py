@@ -0,0 +1,83 @@
+# Права на уровне queryset: правило роли для метода запроса компилируется
+# в фильтр по owner_id, так что чужие строки не грузятся вовсе,
+# а владелец сравнивается по id, без запроса к User.
+from typing import Optional
+from django.db.models import Model, Q, QuerySet
+from rest_framework.filters import BaseFilterBackend
+from .principal import Principal, get_principal
+from .rbac import ALL_BITS, METHOD_ACTIONS, OWN_BITS
+
+
+class ElementScope:
+    __slots__ = ("model", "owner_field")
+
+    def __init__(self, model: type[Model], owner_field: str):
+        self.model = model
+        self.owner_field = owner_field  # column name, e.g. "owner_id"
+
+
+# element_code -> ElementScope; filled by the apps' ready()
+_registry: dict[str, ElementScope] = {}
+
+
+def register_element(code: str, model: type[Model], owner_field: str = "owner"):
+    """
+    Связывает BusinessElement.code с моделью и полем владельца (FK на User).
+    """
+    field = model._meta.get_field(owner_field)
+    _registry[code] = ElementScope(model, field.attname)
+
+
+def get_element_scope(code: str) -> ElementScope:
+    try:
+        return _registry[code]
+    except KeyError:
+        raise LookupError(f"No model registered for element {code!r}") from None
+
+
+def registered_elements() -> dict[str, ElementScope]:
+    return dict(_registry)
+
+
+def scope_q(principal: Principal, element_code: str, action: str) -> Optional[Q]:
+    """
+    Rows of the element the principal may `action`: Q() - all of them,
+    Q(owner_id=...) - own ones, None - none.
+    """
+    mask = principal.get_mask(element_code)
+    if mask & ALL_BITS[action]:
+        return Q()
+    if mask & OWN_BITS[action] and principal.user_id is not None:
+        owner_field = get_element_scope(element_code).owner_field
+        return Q(**{owner_field: principal.user_id})
+    return None
+
+
+def scope_queryset(
+    queryset: QuerySet, principal: Principal, element_code: str, action: str = "read"
+) -> QuerySet:
+    q = scope_q(principal, element_code, action)
+    if q is None:
+        return queryset.none()
+    return queryset.filter(q) if q else queryset
+
+
+def scoped(principal: Principal, element_code: str, action: str = "read") -> QuerySet:
+    # all rows of the registered model the principal may `action`
+    model = get_element_scope(element_code).model
+    return scope_queryset(model._default_manager.all(), principal, element_code, action)
+
+
+class AccessRuleFilterBackend(BaseFilterBackend):
+    """
+    DRF filter backend for views with `element_code`: list and detail querysets
+    only hold rows the caller's rule allows for the request method, so a foreign
+    object is a 404 and the object-level check never has to load anything.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        element_code = getattr(view, "element_code", None)
+        action = METHOD_ACTIONS.get(request.method.upper())
+        if not element_code or action is None:
+            return queryset.none()
+        return scope_queryset(queryset, get_principal(request), element_code, action)
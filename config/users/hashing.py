@@ -0,0 +1,175 @@
+# bcrypt в отдельном ограниченном пуле процессов.
+# Шторм логинов не должен съедать CPU воркеров, которые обслуживают остальной трафик:
+# хэшей одновременно считается не больше POOL_SIZE, в очереди ждут не больше MAX_QUEUE,
+# всё остальное сразу получает 503 + Retry-After.
+# Модуль не импортирует модели: он же грузится в дочерних процессах пула.
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = "Too many login attempts are being processed, try again later."
+    default_code = "hashing_busy"
+
+    def __init__(self, wait: int = 1):
+        super().__init__()
+        # DRF's exception handler turns `wait` into a Retry-After header
+        self.wait = wait
+
+
+# --- executed in pool processes ---
+
+
+def _timed(fn, *args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time() - started
+
+
+def _hashpw(password_bytes: bytes):
+    return _timed(bcrypt.hashpw, password_bytes, bcrypt.gensalt())
+
+
+def _checkpw(password_bytes: bytes, hash_bytes: bytes):
+    return _timed(bcrypt.checkpw, password_bytes, hash_bytes)
+
+
+# --- pool ---
+
+
+class PasswordHasherPool:
+    def __init__(self, pool_size: int, max_queue: int, retry_after: int = 1):
+        self.pool_size = pool_size
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(pool_size + max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a threaded server process is not safe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.pool_size,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        """
+        Ставит задачу в пул или сразу бросает HashingBusy, если пул и очередь заняты.
+        Результат future — значение fn без служебных таймингов.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy(self.retry_after)
+
+        submitted_at = time.time()
+        try:
+            inner = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # a worker died: start a fresh pool next time
+            self._executor = None
+            self._slots.release()
+            raise HashingBusy(self.retry_after)
+
+        self.submitted += 1
+        outer = Future()
+
+        def done(f: Future):
+            self._slots.release()
+            try:
+                result, started, elapsed = f.result()
+            except BaseException as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._executor = None
+                outer.set_exception(e)
+                return
+
+            wait = max(started - submitted_at, 0.0)
+            self.completed += 1
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+            self.hash_time_total += elapsed
+            self.hash_time_max = max(self.hash_time_max, elapsed)
+            outer.set_result(result)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "pool_size": self.pool_size,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_avg": self.queue_wait_total / completed,
+            "queue_wait_max": self.queue_wait_max,
+            "hash_time_avg": self.hash_time_total / completed,
+            "hash_time_max": self.hash_time_max,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hasher_pool():
+    """
+    Пул из settings.PASSWORD_HASHING или None, если POOL_SIZE = 0 (bcrypt в потоке запроса).
+    """
+    global _pool
+    config = {
+        "POOL_SIZE": 2,
+        "MAX_QUEUE": 8,
+        "RETRY_AFTER": 1,
+        **getattr(settings, "PASSWORD_HASHING", {}),
+    }
+    if not config["POOL_SIZE"]:
+        return None
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHasherPool(
+                    config["POOL_SIZE"], config["MAX_QUEUE"], config["RETRY_AFTER"]
+                )
+    return _pool
+
+
+def submit_hash(password_bytes: bytes) -> Future:
+    pool = get_hasher_pool()
+    if pool is None:
+        future = Future()
+        future.set_result(_hashpw(password_bytes)[0])
+        return future
+    return pool.submit(_hashpw, password_bytes)
+
+
+def submit_check(password_bytes: bytes, hash_bytes: bytes) -> Future:
+    pool = get_hasher_pool()
+    if pool is None:
+        future = Future()
+        future.set_result(_checkpw(password_bytes, hash_bytes)[0])
+        return future
+    return pool.submit(_checkpw, password_bytes, hash_bytes)
@@ -0,0 +1,390 @@
+# Бенчмарк горячих путей аутентификации и RBAC.
+# Гоняется на отдельной тестовой БД (SQLite или Postgres из settings),
+# результаты пишутся в JSON с id коммита, чтобы сравнивать прогоны между собой.
+import json
+import platform
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, RequestFactory, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer
+from config import metrics
+from config.introspect import wsgi_introspect
+from config.renderers import OrjsonRenderer
+from mockapp.models import Task
+from mockapp.serializers import TaskSerializer
+from users.models import AccessRule, BusinessElement, Role, User
+from users.permissions import AccessRulePermission
+from users.principal import get_user_from_request
+from users.services import create_access_token, decode_access_token, hash_password
+
+QUERIES_RE = re.compile(r'queries;desc="(\d+)"')
+PASSWORD = "bench-password"
+
+
+def percentile(sorted_values, p: float) -> float:
+    # nearest-rank
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def git_commit():
+    root = Path(settings.BASE_DIR)
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain"],
+                cwd=root,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        )
+    except OSError:
+        return None, None
+    return commit or None, dirty
+
+
+def run_scenario(op, iterations: int, concurrency: int, warmup: int) -> dict:
+    """
+    op() -> число SQL-запросов операции (или None) либо бросает исключение.
+    iterations операций делятся между concurrency потоками.
+    """
+    # never warm up longer than we measure (login is ~0.3 s per op)
+    for _ in range(min(warmup, max(iterations // 10, 1))):
+        op()
+
+    latencies, queries, errors = [], [], [0]
+    lock = threading.Lock()
+
+    def worker(count: int):
+        local_latencies, local_queries, local_errors = [], [], 0
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    result = op()
+                except Exception:
+                    local_errors += 1
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+                if result is not None:
+                    local_queries.append(result)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            errors[0] += local_errors
+
+    shares = [iterations // concurrency] * concurrency
+    for i in range(iterations % concurrency):
+        shares[i] += 1
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(iterations)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = 1000
+    return {
+        "ops": len(latencies),
+        "errors": errors[0],
+        "concurrency": concurrency,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * ms if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * ms,
+        "p95_ms": percentile(latencies, 95) * ms,
+        "p99_ms": percentile(latencies, 99) * ms,
+        "queries_per_op": sum(queries) / len(queries) if queries else None,
+    }
+
+
+def counted(fn):
+    # in-process ops: queries counted by the same DB wrapper as /metrics
+    def op():
+        request_metrics = metrics.start_request()
+        try:
+            fn()
+        finally:
+            metrics.finish_request()
+        return request_metrics.queries
+
+    return op
+
+
+class Command(BaseCommand):
+    help = "Benchmark auth/RBAC hot paths and store the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument(
+            "--http-iterations",
+            type=int,
+            default=500,
+            help="iterations of HTTP scenarios",
+        )
+        parser.add_argument("--login-iterations", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--tasks", type=int, default=1000)
+        parser.add_argument(
+            "--only", nargs="*", help="run only these scenarios (names as in output)"
+        )
+        parser.add_argument(
+            "--output",
+            help="JSON file for results (default: bench-results/<time>-<commit>.json)",
+        )
+        parser.add_argument("--compare", help="previous JSON results to diff against")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="keep the benchmark database"
+        )
+
+    def handle(self, *args, **options):
+        # a separate test database: the benchmark never touches real data
+        setup_test_environment(debug=False)
+        runner = DiscoverRunner(verbosity=0, keepdb=options["keepdb"])
+        old_config = runner.setup_databases()
+        try:
+            # no throttling: we measure the work behind it
+            with override_settings(
+                AUTH_THROTTLE={
+                    **getattr(settings, "AUTH_THROTTLE", {}),
+                    "IP_RATE": None,
+                    "EMAIL_RATE": None,
+                }
+            ):
+                results = self.run_benchmarks(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        self.report(results, options)
+
+    def setup_fixture(self, task_count: int):
+        role, _ = Role.objects.get_or_create(name="bench-user")
+        element, _ = BusinessElement.objects.get_or_create(
+            code="task", defaults={"name": "Task"}
+        )
+        AccessRule.objects.update_or_create(
+            role=role,
+            element=element,
+            defaults={
+                "can_read": True,
+                "can_create": True,
+                "can_update": True,
+                "can_delete": True,
+            },
+        )
+        user, _ = User.objects.update_or_create(
+            email="bench@example.com",
+            defaults={
+                "full_name": "Bench",
+                "password_hash": hash_password(PASSWORD),
+                "role": role,
+                "is_active": True,
+            },
+        )
+        missing = task_count - Task.objects.filter(owner=user).count()
+        if missing > 0:
+            Task.objects.bulk_create(
+                [Task(title=f"bench {i}", owner=user) for i in range(missing)],
+                batch_size=1000,
+            )
+        return user, Task.objects.filter(owner=user).order_by("id").first()
+
+    def scenarios(self, user, task, options) -> dict:
+        token = create_access_token(user.id)
+        auth = f"Bearer {token}"
+        factory = RequestFactory()
+        permission = AccessRulePermission()
+
+        class TaskView:
+            element_code = "task"
+
+        view = TaskView()
+
+        def request():
+            return factory.get("/api/tasks/", HTTP_AUTHORIZATION=auth)
+
+        def permission_list():
+            permission.has_permission(request(), view)
+
+        def permission_object():
+            permission.has_object_permission(request(), view, task)
+
+        # rendering: one page of the task list
+        page = TaskSerializer(
+            Task.objects.filter(owner=user).order_by("id")[:50], many=True
+        ).data
+        serializer = TaskSerializer()
+        json_renderer, orjson_renderer = JSONRenderer(), OrjsonRenderer()
+
+        # what nginx auth_request sends to the introspection endpoint
+        introspect_environ = {
+            "REQUEST_METHOD": "GET",
+            "QUERY_STRING": "",
+            "HTTP_AUTHORIZATION": auth,
+            "HTTP_X_ELEMENT_CODE": "task",
+            "HTTP_X_ORIGINAL_METHOD": "PATCH",
+        }
+
+        def introspect():
+            # has its own request metrics, so no counted() around it
+            wsgi_introspect(introspect_environ, lambda status, headers: None)
+
+        clients = threading.local()
+
+        def http(method, path, data=None, expected=200, authorized=True):
+            def op():
+                client = getattr(clients, "client", None)
+                if client is None:
+                    client = clients.client = Client()
+                headers = {"HTTP_AUTHORIZATION": auth} if authorized else {}
+                if data is not None:
+                    response = getattr(client, method)(
+                        path,
+                        json.dumps(data),
+                        content_type="application/json",
+                        **headers,
+                    )
+                else:
+                    response = getattr(client, method)(path, **headers)
+                if response.status_code != expected:
+                    raise RuntimeError(response.status_code)
+                match = QUERIES_RE.search(response.get("Server-Timing", ""))
+                return int(match.group(1)) if match else None
+
+            return op
+
+        n, http_n = options["iterations"], options["http_iterations"]
+        c = options["concurrency"]
+        return {
+            "token_issue": (counted(lambda: create_access_token(user.id)), n, 1),
+            "token_decode": (counted(lambda: decode_access_token(token)), n, 1),
+            "get_user_from_request": (
+                counted(lambda: get_user_from_request(request())),
+                n,
+                1,
+            ),
+            "permission_list": (counted(permission_list), n, 1),
+            "permission_object": (counted(permission_object), n, 1),
+            # per object: stock DRF vs the compiled readers
+            "serialize_task_drf": (
+                counted(lambda: ModelSerializer.to_representation(serializer, task)),
+                n,
+                1,
+            ),
+            "serialize_task_fast": (
+                counted(lambda: serializer.to_representation(task)),
+                n,
+                1,
+            ),
+            "render_tasks_page_json": (
+                counted(lambda: json_renderer.render(page)),
+                n,
+                1,
+            ),
+            "render_tasks_page_orjson": (
+                counted(lambda: orjson_renderer.render(page)),
+                n,
+                1,
+            ),
+            "introspect": (introspect, n, 1),
+            "login": (
+                http(
+                    "post",
+                    "/api/auth/login/",
+                    {"email": user.email, "password": PASSWORD},
+                    authorized=False,
+                ),
+                options["login_iterations"],
+                min(c, 2),
+            ),
+            "http_me": (http("get", "/api/me/"), http_n, c),
+            "http_tasks_list": (http("get", "/api/tasks/"), http_n, c),
+            "http_tasks_detail": (http("get", f"/api/tasks/{task.pk}/"), http_n, c),
+        }
+
+    def run_benchmarks(self, options) -> dict:
+        user, task = self.setup_fixture(options["tasks"])
+        for conn in connections.all(initialized_only=True):
+            metrics.install_db_wrapper(conn)
+
+        scenarios = {}
+        for name, (op, iterations, concurrency) in self.scenarios(
+            user, task, options
+        ).items():
+            if options["only"] and name not in options["only"]:
+                continue
+            self.stderr.write(f"{name}...")
+            scenarios[name] = run_scenario(
+                op, iterations, concurrency, options["warmup"]
+            )
+
+        commit, dirty = git_commit()
+        return {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "tasks": options["tasks"],
+            "scenarios": scenarios,
+        }
+
+    def report(self, results: dict, options):
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)["scenarios"]
+
+        header = f"{'scenario':<24}{'ops/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/op':>6}"
+        self.stdout.write(header + ("    Δ ops/s" if previous else ""))
+        for name, r in results["scenarios"].items():
+            queries = r["queries_per_op"]
+            line = (
+                f"{name:<24}{r['throughput']:>10.0f}{r['p50_ms']:>9.3f}"
+                f"{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+                f"{'-' if queries is None else format(queries, '.1f'):>6}"
+            )
+            if r["errors"]:
+                line += f"  errors: {r['errors']}"
+            before = previous.get(name)
+            if before and before["throughput"]:
+                change = r["throughput"] / before["throughput"] - 1
+                line += f"  {change:+.1%}"
+            self.stdout.write(line)
+
+        output = options["output"]
+        if not output:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            commit = (results["commit"] or "nogit")[:10]
+            output = (
+                Path(settings.BASE_DIR) / "bench-results" / f"{stamp}-{commit}.json"
+            )
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(f"results: {output}")
@@ -0,0 +1,13 @@
+# Чистка отозванных access-токенов, срок которых всё равно истёк.
+# Запускается периодически (cron, systemd timer), а не на пути запроса:
+#   */10 * * * * python manage.py purge_revoked_tokens
+from django.core.management.base import BaseCommand
+from users.revocation import purge_expired_revocations
+
+
+class Command(BaseCommand):
+    help = "Delete revoked access tokens that have expired anyway."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_revocations()
+        self.stdout.write(f"Deleted {deleted} expired revocations.")
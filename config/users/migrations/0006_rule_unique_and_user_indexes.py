@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_refresh_and_revoked_tokens"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["id"],
+                name="user_active_id_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="accessrule",
+            constraint=models.UniqueConstraint(
+                fields=("role", "element"), name="access_rule_role_element_uniq"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("email"),
+                name="user_email_lower_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_rule_unique_and_user_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserAccessEpoch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.PositiveBigIntegerField(unique=True)),
+                ("epoch", models.PositiveBigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="rbacversion",
+            name="user_epoch",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
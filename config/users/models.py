@@ -1,4 +1,9 @@
+from enum import IntFlag
 from django.db import models
+from django.db.models.functions import Lower
+
+# email__lower=... -> LOWER(email) = ..., served by user_email_lower_uniq
+models.EmailField.register_lookup(Lower)
 
 
 class Role(models.Model):
@@ -14,13 +19,56 @@ class User(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # login looks users up by lower(email)
+            models.UniqueConstraint(Lower("email"), name="user_email_lower_uniq"),
+        ]
+        indexes = [
+            # per-request user load: filter(id=..., is_active=True)
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_active=True),
+                name="user_active_id_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # role and status as loaded: save() compares against them (users.signals)
+        if "role_id" in user.__dict__ and "is_active" in user.__dict__:
+            user._loaded_access = (user.role_id, user.is_active)
+        return user
+
 
 class BusinessElement(models.Model):
     code = models.CharField(max_length=100, unique=True)
     name = models.CharField(max_length=255)
 
 
+class Perm(IntFlag):
+    # one bit per AccessRule flag, in field order
+    READ = 1 << 0
+    READ_ALL = 1 << 1
+    CREATE = 1 << 2
+    UPDATE = 1 << 3
+    UPDATE_ALL = 1 << 4
+    DELETE = 1 << 5
+    DELETE_ALL = 1 << 6
+
+
 class AccessRule(models.Model):
+    FLAG_BITS = {
+        "can_read": Perm.READ,
+        "can_read_all": Perm.READ_ALL,
+        "can_create": Perm.CREATE,
+        "can_update": Perm.UPDATE,
+        "can_update_all": Perm.UPDATE_ALL,
+        "can_delete": Perm.DELETE,
+        "can_delete_all": Perm.DELETE_ALL,
+    }
+
     role = models.ForeignKey(Role, on_delete=models.PROTECT)
     element = models.ForeignKey(BusinessElement, on_delete=models.PROTECT)
     can_read = models.BooleanField(default=False)
@@ -30,3 +78,60 @@ class AccessRule(models.Model):
     can_update_all = models.BooleanField(default=False)
     can_delete = models.BooleanField(default=False)
     can_delete_all = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # one rule per (role, element); also the index for rule lookups
+            models.UniqueConstraint(
+                fields=["role", "element"], name="access_rule_role_element_uniq"
+            ),
+        ]
+
+    @classmethod
+    def flags_to_mask(cls, *flags: bool) -> int:
+        # flags in FLAG_BITS order
+        mask = 0
+        for flag, bit in zip(flags, cls.FLAG_BITS.values()):
+            if flag:
+                mask |= bit
+        return int(mask)
+
+    @property
+    def mask(self) -> int:
+        return self.flags_to_mask(*(getattr(self, f) for f in self.FLAG_BITS))
+
+    @mask.setter
+    def mask(self, value: int):
+        for field, bit in self.FLAG_BITS.items():
+            setattr(self, field, bool(value & bit))
+
+
+class RbacVersion(models.Model):
+    # single row; bumped on every Role/BusinessElement/AccessRule change
+    # so that each worker knows when to rebuild its in-memory rule matrix
+    version = models.PositiveBigIntegerField(default=0)
+    # bumped on a user's role change, soft delete or delete (UserAccessEpoch)
+    user_epoch = models.PositiveBigIntegerField(default=0)
+
+
+class UserAccessEpoch(models.Model):
+    # RbacVersion.user_epoch at the user's last access change: permission claims
+    # in that user's tokens issued before it are stale. No FK — outlives the user
+    user_id = models.PositiveBigIntegerField(unique=True)
+    epoch = models.PositiveBigIntegerField(db_index=True)
+
+
+class RefreshToken(models.Model):
+    # opaque refresh token; only its sha256 is stored
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    token_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class RevokedToken(models.Model):
+    # revoked access tokens (by jti), kept until they would have expired anyway
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -1,88 +1,68 @@
 from rest_framework.permissions import BasePermission
-from users.models import User, BusinessElement, AccessRule
-from users.services import get_user_from_request
+from config.metrics import timer
+from users.principal import get_principal
+from users.rbac import METHOD_ALL_BITS, METHOD_ANY_BITS, METHOD_OWN_BITS
 
 
 class AccessRulePermission(BasePermission):
-    def _get_user(self, request):
-        user = get_user_from_request(request)
-        if not isinstance(user, User) or not user.is_active:
-            return None
-        return user
-
-    def _get_rule(self, user, view):
+    def _get_mask(self, principal, view):
         element_code = getattr(view, "element_code", None)
-        if not element_code:
-            return None
-
-        try:
-            element = BusinessElement.objects.get(code=element_code)
-            return AccessRule.objects.get(role=user.role, element=element)
-        except (BusinessElement.DoesNotExist, AccessRule.DoesNotExist):
-            return None
+        return principal.get_mask(element_code)
 
     # GLOBAL PERMISSIONS
+    @timer("perm")
     def has_permission(self, request, view):
-        user = self._get_user(request)
-        if not user:
+        principal = get_principal(request)
+        if not principal.is_authenticated:
             return False
 
-        rule = self._get_rule(user, view)
-        if not rule:
-            return False
-
-        method = request.method.upper()
-
-        if method in ("GET", "HEAD", "OPTIONS"):
-            return rule.can_read or rule.can_read_all
-        if method == "POST":
-            return rule.can_create
-        if method in ("PUT", "PATCH"):
-            return rule.can_update or rule.can_update_all
-        if method == "DELETE":
-            return rule.can_delete or rule.can_delete_all
-
-        return False
+        mask = self._get_mask(principal, view)
+        return bool(mask & METHOD_ANY_BITS.get(request.method.upper(), 0))
 
     # PERMISSIONS on the OBJECT level (detail)
+    @timer("perm")
     def has_object_permission(self, request, view, obj):
-        user = self._get_user(request)
-        if not user:
-            return False
-
-        rule = self._get_rule(user, view)
-        if not rule:
+        principal = get_principal(request)
+        if not principal.is_authenticated:
             return False
 
+        mask = self._get_mask(principal, view)
         method = request.method.upper()
 
         # firstly check *_all rules
-        if method in ("GET", "HEAD", "OPTIONS") and rule.can_read_all:
-            return True
-        if method in ("PUT", "PATCH") and rule.can_update_all:
-            return True
-        if method == "DELETE" and rule.can_delete_all:
+        if mask & METHOD_ALL_BITS.get(method, 0):
             return True
 
         # or check «simple» rules and it's owner
-        owner = getattr(obj, "owner", None)
-
-        if method in ("GET", "HEAD", "OPTIONS"):
-            return rule.can_read and owner == user
-        if method in ("PUT", "PATCH"):
-            return rule.can_update and owner == user
-        if method == "DELETE":
-            return rule.can_delete and owner == user
+        # compare by id, so obj.owner is never fetched
+        if mask & METHOD_OWN_BITS.get(method, 0):
+            return getattr(obj, "owner_id", None) == principal.user_id
 
         return False
 
 
+class BulkAccessRulePermission(AccessRulePermission):
+    """
+    Пакетная ручка: пускаем, если роль может хоть что-то из create/update/delete,
+    а каждый элемент пакета view проверяет по той же маске.
+    """
+
+    bulk_methods = ("POST", "PATCH", "DELETE")
+
+    @timer("perm")
+    def has_permission(self, request, view):
+        principal = get_principal(request)
+        if not principal.is_authenticated:
+            return False
+
+        mask = self._get_mask(principal, view)
+        return any(mask & METHOD_ANY_BITS[method] for method in self.bulk_methods)
+
+
 class IsAdminRole(BasePermission):
+    @timer("perm")
     def has_permission(self, request, view):
-        user = get_user_from_request(request)
+        user = get_principal(request).user
 
-        return (
-            isinstance(user, User)
-            and user.is_active
-            and getattr(user.role, "name", None) == "admin"
-        )  # True if admin
+        # role is already joined by the principal
+        return user is not None and getattr(user.role, "name", None) == "admin"
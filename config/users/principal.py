@@ -0,0 +1,223 @@
+import logging
+from typing import Optional
+from django.http import HttpRequest
+from .cache import aget_cached_user, get_cached_user
+from .models import User
+from .rbac import RuleMatrix, aget_rule_matrix, get_rule_matrix
+from .revocation import get_revocation_list
+from .services import decode_access_token
+
+logger = logging.getLogger(__name__)
+
+_NOT_LOADED = object()
+
+
+class Principal:
+    """
+    Кто делает запрос. Разбирается один раз на запрос (JWT -> claims -> user)
+    и дальше переиспользуется middleware, permissions и views.
+    """
+
+    def __init__(self, claims: Optional[dict] = None, user: Optional[User] = None):
+        self.claims = claims or {}
+        self._user = user
+        self.user_id = user.id if user is not None else None
+        self.role_id = user.role_id if user is not None else None
+        self._masks = None  # {element_code: mask} from token claims
+        self._matrix = None
+
+    @classmethod
+    def from_claims(cls, claims: dict, matrix: RuleMatrix) -> "Principal":
+        """
+        Principal из токена с вшитыми правами: ни пользователя, ни правил
+        из БД не нужно. Сам User подгрузится, только если к нему обратятся.
+        """
+        principal = cls(claims)
+        principal._user = _NOT_LOADED
+        principal.user_id = claims["user_id"]
+        principal.role_id = claims.get("rid")
+        principal._masks = claims.get("prm") or {}
+        principal._matrix = matrix
+        return principal
+
+    @property
+    def user(self) -> Optional[User]:
+        if self._user is _NOT_LOADED:
+            self._user = get_cached_user(self.user_id)
+        return self._user
+
+    async def auser(self) -> Optional[User]:
+        if self._user is _NOT_LOADED:
+            self._user = await aget_cached_user(self.user_id)
+        return self._user
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+    @property
+    def matrix(self) -> RuleMatrix:
+        # one snapshot per request, so all checks see the same rules
+        if self._matrix is None:
+            self._matrix = get_rule_matrix()
+        return self._matrix
+
+    async def amatrix(self) -> RuleMatrix:
+        # for async views: the principal may have been resolved by the sync
+        # middleware (WSGI), which leaves the matrix to the first sync access
+        if self._matrix is None:
+            self._matrix = await aget_rule_matrix()
+        return self._matrix
+
+    def get_mask(self, element_code: Optional[str]) -> int:
+        if not element_code or not self.is_authenticated:
+            return 0
+        if self._masks is not None:
+            return self._masks.get(element_code, 0)
+        return self.matrix.get(self.role_id, element_code)
+
+
+def build_permission_claims(user: User, matrix: Optional[RuleMatrix] = None) -> dict:
+    """
+    Claims for the opt-in "fat" token (settings.JWT_EMBED_PERMISSIONS):
+    rid - role id, act - is_active, prm - {element_code: mask},
+    pep - permission epoch (RBAC version the masks were taken from),
+    uep - user epoch (the claims are stale once the user's access epoch is newer).
+    """
+    matrix = matrix or get_rule_matrix()
+    return {
+        "rid": user.role_id,
+        "act": user.is_active,
+        "prm": matrix.role_masks(user.role_id),
+        "pep": matrix.version,
+        "uep": matrix.user_epoch,
+    }
+
+
+def claims_are_current(payload: dict, matrix: RuleMatrix) -> bool:
+    # rule edits invalidate every fat token, a user's access change only theirs
+    return payload["pep"] == matrix.version and payload.get(
+        "uep", 0
+    ) >= matrix.user_access_epoch(payload["user_id"])
+
+
+def parse_bearer_token(auth_header: Optional[str]) -> Optional[str]:
+    if not auth_header:
+        return None
+
+    parts = auth_header.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        return None
+
+    return parts[1].strip().strip('"')
+
+
+def get_bearer_token(request: HttpRequest) -> Optional[str]:
+    return parse_bearer_token(
+        request.META.get("HTTP_AUTHORIZATION") or request.headers.get("Authorization")
+    )
+
+
+def _decode_token(token: Optional[str]) -> Optional[dict]:
+    if not token:
+        return None
+
+    try:
+        return decode_access_token(token)
+    except Exception as e:
+        # bad/expired tokens are routine: 401 for the caller, no noise in the logs
+        logger.debug("access token rejected: %s", e)
+        return None
+
+
+def principal_from_token(token: Optional[str]) -> Principal:
+    """
+    Principal по одному access-токену, без запроса: используется и view-стеком,
+    и лёгкой ручкой интроспекции (config.introspect).
+    """
+    payload = _decode_token(token)
+    if payload is None:
+        return Principal()
+
+    # bloom filter in memory; the DB is asked only on a "maybe"
+    jti = payload.get("jti")
+    if jti and get_revocation_list().is_revoked(jti):
+        return Principal()
+
+    user_id = payload.get("user_id")
+    if not user_id:
+        return Principal(payload)
+
+    # embedded permissions are trusted only while their epochs are current;
+    # a rule change bumps the RBAC version, a role change or soft delete the
+    # user's epoch, and then the token falls back to the DB path below
+    if "pep" in payload and payload.get("act"):
+        matrix = get_rule_matrix()
+        if claims_are_current(payload, matrix):
+            return Principal.from_claims(payload, matrix)
+
+    return Principal(payload, get_cached_user(user_id))
+
+
+def resolve_principal(request: HttpRequest) -> Principal:
+    return principal_from_token(get_bearer_token(request))
+
+
+async def aprincipal_from_token(token: Optional[str]) -> Principal:
+    payload = _decode_token(token)
+    if payload is None:
+        return Principal()
+
+    jti = payload.get("jti")
+    if jti and await get_revocation_list().ais_revoked(jti):
+        return Principal()
+
+    user_id = payload.get("user_id")
+    if not user_id:
+        return Principal(payload)
+
+    # the matrix is always taken here, so sync permission code running
+    # inside async views never has to touch the DB for it
+    matrix = await aget_rule_matrix()
+    if "pep" in payload and payload.get("act") and claims_are_current(payload, matrix):
+        return Principal.from_claims(payload, matrix)
+
+    principal = Principal(payload, await aget_cached_user(user_id))
+    principal._matrix = matrix
+    return principal
+
+
+async def aresolve_principal(request: HttpRequest) -> Principal:
+    return await aprincipal_from_token(get_bearer_token(request))
+
+
+def get_principal(request: HttpRequest) -> Principal:
+    """
+    Principal текущего запроса. Принимает и django HttpRequest, и DRF Request;
+    результат кэшируется на django-запросе, так что JWT декодируется
+    и пользователь грузится не больше одного раза.
+    """
+    django_request = getattr(request, "_request", request)
+
+    principal = getattr(django_request, "principal", None)
+    if principal is None:
+        principal = resolve_principal(django_request)
+        django_request.principal = principal
+    return principal
+
+
+def get_user_from_request(request: HttpRequest) -> Optional[User]:
+    """
+    Текущий активный пользователь (или None) из principal запроса.
+    """
+    return get_principal(request).user
+
+
+async def aget_principal(request: HttpRequest) -> Principal:
+    django_request = getattr(request, "_request", request)
+
+    principal = getattr(django_request, "principal", None)
+    if principal is None:
+        principal = await aresolve_principal(django_request)
+        django_request.principal = principal
+    return principal
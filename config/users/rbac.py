@@ -0,0 +1,327 @@
+# Скомпилированная матрица прав role × element.
+# Таблица правил крошечная и почти не меняется, а читается на каждом запросе,
+# поэтому держим её в памяти процесса и пересобираем только при смене версии.
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .models import (
+    AccessRule,
+    BusinessElement,
+    Perm,
+    RbacVersion,
+    Role,
+    UserAccessEpoch,
+)
+
+# HTTP method -> action
+METHOD_ACTIONS = {
+    "GET": "read",
+    "HEAD": "read",
+    "OPTIONS": "read",
+    "POST": "create",
+    "PUT": "update",
+    "PATCH": "update",
+    "DELETE": "delete",
+}
+
+# action -> bit that allows it on own objects / on any object
+OWN_BITS = {
+    "read": Perm.READ,
+    "create": Perm.CREATE,
+    "update": Perm.UPDATE,
+    "delete": Perm.DELETE,
+}
+ALL_BITS = {
+    "read": Perm.READ_ALL,
+    "create": 0,
+    "update": Perm.UPDATE_ALL,
+    "delete": Perm.DELETE_ALL,
+}
+
+# precomputed per method, so every check is a single `mask & bits`:
+# ANY - view level (own or all), OWN / ALL - object level
+METHOD_ANY_BITS = {m: OWN_BITS[a] | ALL_BITS[a] for m, a in METHOD_ACTIONS.items()}
+METHOD_OWN_BITS = {m: OWN_BITS[a] for m, a in METHOD_ACTIONS.items()}
+METHOD_ALL_BITS = {m: ALL_BITS[a] for m, a in METHOD_ACTIONS.items()}
+
+
+class RuleMatrix:
+    """
+    Immutable snapshot of all access rules with O(1) (role_id, element_code) lookup,
+    plus the access epochs of users whose role or status has changed.
+    """
+
+    __slots__ = ("version", "_masks", "_by_role", "user_epoch", "_user_epochs")
+
+    def __init__(self, version: int, masks: dict):
+        self.version = version
+        self._masks = MappingProxyType(masks)
+        self.user_epoch = 0
+        self._user_epochs = MappingProxyType({})
+
+        by_role = {}
+        for (role_id, code), mask in masks.items():
+            by_role.setdefault(role_id, {})[code] = mask
+        self._by_role = MappingProxyType(
+            {role_id: MappingProxyType(m) for role_id, m in by_role.items()}
+        )
+
+    @staticmethod
+    def rows():
+        return AccessRule.objects.values_list(
+            "role_id", "element__code", *AccessRule.FLAG_BITS
+        )
+
+    @classmethod
+    def from_rows(cls, version: int, rows) -> "RuleMatrix":
+        masks = {
+            (role_id, code): AccessRule.flags_to_mask(*flags)
+            for role_id, code, *flags in rows
+        }
+        return cls(version, masks)
+
+    @classmethod
+    def build(cls, version: int) -> "RuleMatrix":
+        return cls.from_rows(version, cls.rows())
+
+    @classmethod
+    async def abuild(cls, version: int) -> "RuleMatrix":
+        return cls.from_rows(version, [row async for row in cls.rows()])
+
+    def with_user_epochs(self, user_epoch: int, rows) -> "RuleMatrix":
+        """
+        Same rules, user epochs updated with (user_id, epoch) rows.
+        """
+        matrix = RuleMatrix.__new__(RuleMatrix)
+        matrix.version = self.version
+        matrix._masks = self._masks
+        matrix._by_role = self._by_role
+        matrix.user_epoch = user_epoch
+        matrix._user_epochs = MappingProxyType({**self._user_epochs, **dict(rows)})
+        return matrix
+
+    def user_access_epoch(self, user_id: Optional[int]) -> int:
+        # 0 = role and status never changed
+        return self._user_epochs.get(user_id, 0)
+
+    def get(self, role_id: Optional[int], element_code: str) -> int:
+        # 0 = no rule = nothing allowed
+        return self._masks.get((role_id, element_code), 0)
+
+    def role_masks(self, role_id: Optional[int]) -> dict:
+        """
+        Whole permission set of a role as {element_code: mask}.
+        """
+        return dict(self._by_role.get(role_id, {}))
+
+    def __len__(self):
+        return len(self._masks)
+
+
+_matrix: Optional[RuleMatrix] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_rbac_version() -> int:
+    version = RbacVersion.objects.values_list("version", flat=True).first()
+    return version or 0
+
+
+def _versions_query():
+    # (rules version, user epoch) in one query
+    return RbacVersion.objects.values_list("version", "user_epoch")
+
+
+def _user_epoch_rows(since: int = 0):
+    return UserAccessEpoch.objects.filter(epoch__gt=since).values_list(
+        "user_id", "epoch"
+    )
+
+
+def _needs_rebuild(matrix: Optional[RuleMatrix], version: int, user_epoch: int):
+    # a rule change rebuilds everything; a user change only adds its epochs
+    return matrix is None or matrix.version != version or matrix.user_epoch > user_epoch
+
+
+def get_rule_matrix() -> RuleMatrix:
+    """
+    Текущая матрица. Версию в БД сверяем не чаще, чем раз в
+    RBAC_VERSION_CHECK_SECONDS, так что другие воркеры увидят изменение
+    правил с задержкой не больше этого интервала.
+    """
+    global _matrix, _checked_at
+
+    interval = getattr(settings, "RBAC_VERSION_CHECK_SECONDS", 5)
+    matrix = _matrix
+    if matrix is not None and time.monotonic() - _checked_at < interval:
+        return matrix
+
+    with _lock:
+        # another thread could have refreshed it while we were waiting
+        if _matrix is not None and time.monotonic() - _checked_at < interval:
+            return _matrix
+
+        # version is read before the rules: a concurrent change can only make
+        # the snapshot newer than its version, never older
+        version, user_epoch = _versions_query().first() or (0, 0)
+        if _needs_rebuild(_matrix, version, user_epoch):
+            _matrix = RuleMatrix.build(version).with_user_epochs(
+                user_epoch, _user_epoch_rows()
+            )
+        elif _matrix.user_epoch != user_epoch:
+            _matrix = _matrix.with_user_epochs(
+                user_epoch, _user_epoch_rows(_matrix.user_epoch)
+            )
+        _checked_at = time.monotonic()
+        return _matrix
+
+
+async def aget_rule_matrix() -> RuleMatrix:
+    """
+    Async-вариант get_rule_matrix() на async ORM, без перехода в поток.
+    Без блокировки: параллельная пересборка безвредна, побеждает последняя.
+    """
+    global _matrix, _checked_at
+
+    interval = getattr(settings, "RBAC_VERSION_CHECK_SECONDS", 5)
+    matrix = _matrix
+    if matrix is not None and time.monotonic() - _checked_at < interval:
+        return matrix
+
+    version, user_epoch = await _versions_query().afirst() or (0, 0)
+    if _needs_rebuild(matrix, version, user_epoch):
+        matrix = (await RuleMatrix.abuild(version)).with_user_epochs(
+            user_epoch, [row async for row in _user_epoch_rows()]
+        )
+        _matrix = matrix
+    elif matrix.user_epoch != user_epoch:
+        rows = [row async for row in _user_epoch_rows(matrix.user_epoch)]
+        matrix = matrix.with_user_epochs(user_epoch, rows)
+        _matrix = matrix
+    _checked_at = time.monotonic()
+    return matrix
+
+
+def invalidate_rule_matrix():
+    # force a version check on the next get_rule_matrix() call
+    global _checked_at
+    _checked_at = 0.0
+
+
+def bump_rbac_version():
+    updated = RbacVersion.objects.update(version=F("version") + 1)
+    if not updated:
+        RbacVersion.objects.create(version=1)
+
+    invalidate_rule_matrix()
+    # and once more after commit, so the rebuild sees the committed rows
+    transaction.on_commit(invalidate_rule_matrix)
+
+
+def bump_user_access_epoch(user_id: int):
+    """
+    Делает устаревшими вшитые права только в токенах этого пользователя
+    (смена роли, soft delete, удаление); матрица правил не пересобирается.
+    """
+    updated = RbacVersion.objects.update(user_epoch=F("user_epoch") + 1)
+    if not updated:
+        RbacVersion.objects.create(user_epoch=1)
+    # the counter row stays locked until commit, so epochs commit in order
+    # and workers can load them incrementally
+    epoch = RbacVersion.objects.values_list("user_epoch", flat=True).first()
+    UserAccessEpoch.objects.update_or_create(user_id=user_id, defaults={"epoch": epoch})
+
+    invalidate_rule_matrix()
+    transaction.on_commit(invalidate_rule_matrix)
+
+
+# --- role × element grid for admins (import/export) ---
+
+
+def export_rule_grid() -> dict:
+    """
+    Все правила как {role_name: {element_code: {flag: bool}}}, одним запросом.
+    """
+    rules = {}
+    rows = AccessRule.objects.order_by("role__name", "element__code").values_list(
+        "role__name", "element__code", *AccessRule.FLAG_BITS
+    )
+    for role, code, *flags in rows:
+        rules.setdefault(role, {})[code] = dict(zip(AccessRule.FLAG_BITS, flags))
+    return {"version": get_rbac_version(), "rules": rules}
+
+
+def _ensure(model, field: str, values, defaults=lambda value: {}) -> dict:
+    # {value: pk}, missing rows are created with one bulk insert
+    ids = dict(
+        model.objects.filter(**{f"{field}__in": values}).values_list(field, "pk")
+    )
+    missing = [value for value in values if value not in ids]
+    if missing:
+        model.objects.bulk_create(
+            [model(**{field: value, **defaults(value)}) for value in missing]
+        )
+        ids.update(
+            model.objects.filter(**{f"{field}__in": missing}).values_list(field, "pk")
+        )
+    return ids
+
+
+@transaction.atomic
+def import_rule_grid(rules: dict, element_names: Optional[dict] = None) -> dict:
+    """
+    Upsert ячеек {role_name: {element_code: {flag: bool}}}: ячейка задаёт правило
+    целиком (не переданные флаги — False), не упомянутые ячейки не трогаются.
+    Недостающие роли и элементы создаются. Версия RBAC поднимается один раз.
+    """
+    element_names = element_names or {}
+    codes = sorted({code for cells in rules.values() for code in cells})
+    role_ids = _ensure(Role, "name", sorted(rules))
+    element_ids = _ensure(
+        BusinessElement,
+        "code",
+        codes,
+        lambda code: {"name": element_names.get(code, code)},
+    )
+
+    existing = {
+        (rule.role_id, rule.element_id): rule
+        for rule in AccessRule.objects.filter(
+            role_id__in=role_ids.values(), element_id__in=element_ids.values()
+        )
+    }
+
+    to_create, to_update = [], []
+    for role, cells in rules.items():
+        for code, flags in cells.items():
+            key = (role_ids[role], element_ids[code])
+            mask = AccessRule.flags_to_mask(
+                *(flags.get(field, False) for field in AccessRule.FLAG_BITS)
+            )
+            rule = existing.get(key)
+            if rule is None:
+                rule = AccessRule(role_id=key[0], element_id=key[1])
+                rule.mask = mask
+                to_create.append(rule)
+            elif rule.mask != mask:
+                rule.mask = mask
+                to_update.append(rule)
+
+    # bulk operations send no signals, so the version is bumped here, once
+    AccessRule.objects.bulk_create(to_create)
+    AccessRule.objects.bulk_update(to_update, list(AccessRule.FLAG_BITS))
+    if to_create or to_update:
+        bump_rbac_version()
+
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "unchanged": sum(len(cells) for cells in rules.values())
+        - len(to_create)
+        - len(to_update),
+    }
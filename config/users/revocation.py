@@ -0,0 +1,167 @@
+# Отозванные access-токены (по jti).
+# Проверка идёт на каждом запросе, поэтому сначала спрашиваем bloom-фильтр в памяти:
+# "нет" — точно не отозван, запросов в БД ноль; "может быть" — уточняем в БД.
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+from django.utils import timezone as dj_timezone
+from .models import RevokedToken
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # double hashing: k positions out of one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+
+class RevocationList:
+    """
+    Bloom filter of revoked jti, rebuilt from RevokedToken every refresh_seconds.
+    Revocations made in this worker are added immediately; other workers
+    pick them up on their next rebuild.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, refresh_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._bloom = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        # local revocations not yet seen by a rebuild: (monotonic time, jti)
+        self._pending = []
+
+    def _stale(self) -> bool:
+        return (
+            self._bloom is None
+            or time.monotonic() - self._built_at >= self.refresh_seconds
+        )
+
+    def rebuild(self):
+        # read-only: expired rows are deleted by `manage.py purge_revoked_tokens`,
+        # not by every worker on the request path
+        started = time.monotonic()
+        now = dj_timezone.now()
+        jtis = list(
+            RevokedToken.objects.filter(expires_at__gt=now).values_list(
+                "jti", flat=True
+            )
+        )
+        # keep the false positive rate even if we outgrow the configured capacity
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+
+        # revocations that may have committed after our SELECT
+        self._pending = [(t, jti) for t, jti in self._pending if t >= started]
+        for _, jti in self._pending:
+            bloom.add(jti)
+
+        self._bloom = bloom
+        self._built_at = time.monotonic()
+
+    def _maybe_rebuild(self):
+        if not self._stale():
+            return
+        # one thread rebuilds, the others keep using the old filter meanwhile
+        if self._lock.acquire(blocking=self._bloom is None):
+            try:
+                if self._stale():
+                    self.rebuild()
+            finally:
+                self._lock.release()
+
+    def add(self, jti: str):
+        self._pending.append((time.monotonic(), jti))
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        self._maybe_rebuild()
+        return jti in self._bloom
+
+    def is_revoked(self, jti: str) -> bool:
+        if not self.might_be_revoked(jti):
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti: str) -> bool:
+        if self._stale():
+            await sync_to_async(self._maybe_rebuild)()
+        if jti not in self._bloom:
+            return False
+        return await RevokedToken.objects.filter(jti=jti).aexists()
+
+
+_revocation_list = None
+_revocation_lock = threading.Lock()
+
+
+def get_revocation_list() -> RevocationList:
+    global _revocation_list
+    if _revocation_list is None:
+        with _revocation_lock:
+            if _revocation_list is None:
+                config = {
+                    "BLOOM_CAPACITY": 100000,
+                    "BLOOM_ERROR_RATE": 0.001,
+                    "REFRESH_SECONDS": 30,
+                    **getattr(settings, "TOKEN_REVOCATION", {}),
+                }
+                _revocation_list = RevocationList(
+                    config["BLOOM_CAPACITY"],
+                    config["BLOOM_ERROR_RATE"],
+                    config["REFRESH_SECONDS"],
+                )
+    return _revocation_list
+
+
+def revoke_access_token(payload: Optional[dict]):
+    """
+    Отзывает access-токен по его claims (jti + exp). Токены без jti не отзываются.
+    """
+    jti = (payload or {}).get("jti")
+    if not jti:
+        return
+
+    expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+    try:
+        RevokedToken.objects.get_or_create(jti=jti, defaults={"expires_at": expires_at})
+    except IntegrityError:
+        pass  # revoked concurrently
+    get_revocation_list().add(jti)
+
+
+def purge_expired_revocations() -> int:
+    # expired tokens are rejected by jwt.decode anyway.
+    # Explicit primary: housekeeping must not pin the caller to it (config.db_router)
+    deleted, _ = (
+        RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+        .filter(expires_at__lte=dj_timezone.now())
+        .delete()
+    )
+    return deleted
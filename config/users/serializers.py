@@ -1,4 +1,10 @@
 from rest_framework import serializers
+from config.conditional import make_etag
+from config.serializers import (
+    FastRepresentationMixin,
+    TimedDataMixin,
+    TimedListSerializer,
+)
 from .models import User, Role, BusinessElement, AccessRule
 from .services import hash_password, verify_password
 
@@ -16,7 +22,7 @@ class RegisterSerializer(serializers.Serializer):
         return attrs
 
     def validate_email(self, email_str):
-        if User.objects.filter(email=email_str.lower()).exists():
+        if User.objects.filter(email__lower=email_str.lower()).exists():
             raise serializers.ValidationError("User with this email already exists")
         return email_str.lower()
 
@@ -37,11 +43,14 @@ class RegisterSerializer(serializers.Serializer):
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(
+    TimedDataMixin, FastRepresentationMixin, serializers.ModelSerializer
+):
     role = serializers.CharField(source="role.name", read_only=True)
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = [
             "id",
             "full_name",
@@ -53,17 +62,28 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
 
-class LoginSerializer(serializers.Serializer):
+def user_etag(user: User) -> str:
+    # the role is a separate row: its rename doesn't touch user.updated_at
+    role_name = user.role.name if user.role_id else None
+    return make_etag(
+        "user", user.pk, user.updated_at.isoformat(), user.role_id, role_name
+    )
+
+
+class LoginFieldsSerializer(serializers.Serializer):
+    # only field validation, no DB — used as is by the async login
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
+
+class LoginSerializer(LoginFieldsSerializer):
     def validate(self, attrs):
         email = attrs["email"].lower()
         password = attrs["password"]
 
         # try to find user by email
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.select_related("role").get(email__lower=email)
         except User.DoesNotExist:
             raise serializers.ValidationError("Invalid email or password")
 
@@ -80,6 +100,14 @@ class LoginSerializer(serializers.Serializer):
         return attrs
 
 
+class RefreshSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField()
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField(required=False)
+
+
 class MeUpdateSerializer(serializers.Serializer):
     full_name = serializers.CharField(max_length=255, required=False)
     email = serializers.EmailField(required=False)
@@ -88,7 +116,7 @@ class MeUpdateSerializer(serializers.Serializer):
         email_str = email_str.lower()
         user = self.context["user"]
         # you can't use an email that another user already has
-        if User.objects.filter(email=email_str).exclude(id=user.id).exists():
+        if User.objects.filter(email__lower=email_str).exclude(id=user.id).exists():
             raise serializers.ValidationError("User with this email already exists")
         return email_str
 
@@ -136,3 +164,35 @@ class AccessRuleSerializer(serializers.ModelSerializer):
             "can_delete",
             "can_delete_all",
         ]
+
+
+class AccessRuleFlagsSerializer(serializers.Serializer):
+    can_read = serializers.BooleanField(default=False)
+    can_read_all = serializers.BooleanField(default=False)
+    can_create = serializers.BooleanField(default=False)
+    can_update = serializers.BooleanField(default=False)
+    can_update_all = serializers.BooleanField(default=False)
+    can_delete = serializers.BooleanField(default=False)
+    can_delete_all = serializers.BooleanField(default=False)
+
+
+# {"rules": {role_name: {element_code: {can_*: bool}}}, "elements": {code: name}}
+class AccessRuleMatrixSerializer(serializers.Serializer):
+    rules = serializers.DictField(
+        child=serializers.DictField(child=AccessRuleFlagsSerializer())
+    )
+    # names for elements created by this import (default: the code)
+    elements = serializers.DictField(
+        child=serializers.CharField(max_length=255), required=False
+    )
+
+    def validate_rules(self, rules):
+        role_max = Role._meta.get_field("name").max_length
+        code_max = BusinessElement._meta.get_field("code").max_length
+        for role, cells in rules.items():
+            if not role or len(role) > role_max:
+                raise serializers.ValidationError(f"Invalid role name: {role!r}")
+            for code in cells:
+                if not code or len(code) > code_max:
+                    raise serializers.ValidationError(f"Invalid element code: {code!r}")
+        return rules
@@ -1,18 +1,23 @@
 # bcrypt (хэширование паролей) & PyJWT (генерация токенов)
 # проверка пароля
 # декодирование токена
+import asyncio
 import bcrypt
+import hashlib
 import jwt
+import time
+import uuid
 from datetime import datetime, timedelta
 from django.conf import settings
 from typing import Optional
-from django.http import HttpRequest
-from .models import User
+from .cache import LRUCache
+from .hashing import get_hasher_pool, submit_check, submit_hash
 
 
 def hash_password(password: str):
     password_bytes = password.encode("utf-8")
-    hashed_password = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    # bcrypt runs in the bounded hashing pool (users/hashing.py)
+    hashed_password = submit_hash(password_bytes).result()
     return hashed_password.decode("utf-8")  # в БД — строка
 
 
@@ -20,70 +25,70 @@ def verify_password(password: str, password_hash: str):
     raw_bytes = password.encode("utf-8")
     hash_bytes = password_hash.encode("utf-8")
     # compare
-    return bcrypt.checkpw(raw_bytes, hash_bytes)
+    return submit_check(raw_bytes, hash_bytes).result()
+
+
+async def averify_password(password: str, password_hash: str):
+    raw_bytes = password.encode("utf-8")
+    hash_bytes = password_hash.encode("utf-8")
+    if get_hasher_pool() is None:
+        # no pool configured: still keep bcrypt off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, bcrypt.checkpw, raw_bytes, hash_bytes)
+    return await asyncio.wrap_future(submit_check(raw_bytes, hash_bytes))
 
 
 JWT_ALGORITHM = "HS256"
-JWT_LIFETIME_MINUTES = 60  # token living time
 
 
-def create_access_token(user_id: int):
+def create_access_token(user_id: int, claims: Optional[dict] = None):
     now = datetime.utcnow()
     payload = {
         "user_id": user_id,
+        "jti": uuid.uuid4().hex,  # token id, used for revocation
         "iat": now,
-        "exp": now + timedelta(minutes=JWT_LIFETIME_MINUTES),
+        # short-lived, clients renew it with a refresh token
+        "exp": now + timedelta(minutes=settings.JWT_LIFETIME_MINUTES),
     }
+    if claims:
+        # extra claims (e.g. embedded permissions), never override the base ones
+        payload = {**claims, **payload}
     token = jwt.encode(payload, settings.SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token  # str
 
 
-def decode_access_token(token: str):
-    """
-    Пока просто декодер. Middleware/permissions будем писать позже
-    """
-    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[JWT_ALGORITHM])
-    return payload
+_token_cache = None
+_token_cache_secret = None
 
 
-def get_user_from_request(request: HttpRequest) -> Optional[User]:
+def get_token_cache() -> Optional[LRUCache]:
     """
-    Универсальный способ достать текущего пользователя:
-    1) сначала смотрим на request.user / request.api_user (middleware)
-    2) если там пусто – читаем Authorization и декодируем JWT.
+    Cache of verified claims keyed by a digest of the token. Entries live until
+    the token's exp; the whole cache is dropped when the signing key changes.
     """
-    django_request = getattr(request, "_request", request)
-
-    # 1. Если middleware уже положила пользователя
-    user = getattr(django_request, "user", None) or getattr(
-        django_request, "api_user", None
-    )
-    if isinstance(user, User) and user.is_active:
-        return user
-
-    # 2. Пробуем прочитать заголовок Authorization
-    auth_header = (
-        django_request.META.get("HTTP_AUTHORIZATION")
-        or django_request.headers.get("Authorization")
-        or ""
-    )
-    if not auth_header:
-        return None
+    global _token_cache, _token_cache_secret
 
-    parts = auth_header.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
+    size = getattr(settings, "JWT_DECODE_CACHE_SIZE", 10000)
+    if not size:
         return None
+    if _token_cache is None or _token_cache_secret != settings.SECRET_KEY:
+        _token_cache = LRUCache(size)
+        _token_cache_secret = settings.SECRET_KEY
+    return _token_cache
 
-    token = parts[1].strip().strip('"')
 
-    try:
-        payload = decode_access_token(token)
-    except Exception as e:
-        print("JWT ERROR get_user_from_request:", e)
-        return None
-
-    user_id = payload.get("user_id")
-    if not user_id:
-        return None
-
-    return User.objects.filter(id=user_id, is_active=True).first()
+def decode_access_token(token: str):
+    """
+    Проверяет подпись и exp и возвращает claims. Повторные вызовы с тем же токеном
+    берут уже проверенные claims из кэша — не меняйте возвращаемый dict.
+    """
+    cache = get_token_cache()
+    if cache is None:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[JWT_ALGORITHM])
+
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = cache.get(key)
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        cache.set(key, payload, ttl=payload["exp"] - time.time())
+    return payload
@@ -0,0 +1,73 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import AccessRule, BusinessElement, Role, User
+from .cache import invalidate_all_users, invalidate_user
+from .rbac import bump_rbac_version, bump_user_access_epoch
+from .tokens import revoke_user_refresh_tokens
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # profile update (PATCH /api/me/), soft delete, role change from admin side
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, **kwargs):
+    # cached users carry their role joined
+    invalidate_all_users()
+
+
+@receiver(post_save, sender=AccessRule)
+@receiver(post_delete, sender=AccessRule)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=BusinessElement)
+@receiver(post_delete, sender=BusinessElement)
+def rules_changed(sender, **kwargs):
+    bump_rbac_version()
+
+
+ACCESS_FIELDS = {"role", "role_id", "is_active"}
+
+
+@receiver(pre_save, sender=User)
+def user_access_changing(sender, instance, update_fields=None, **kwargs):
+    # role change or soft delete makes permission claims in issued tokens stale
+    instance._access_changed = False
+    if instance.pk is None:
+        return
+    if update_fields is not None and not ACCESS_FIELDS & set(update_fields):
+        return
+    loaded = getattr(instance, "_loaded_access", None)
+    if loaded is None:
+        # not loaded from the DB (e.g. User(pk=...)): ask it
+        loaded = (
+            User.objects.filter(pk=instance.pk)
+            .values_list("role_id", "is_active")
+            .first()
+        )
+    instance._access_changed = loaded not in (
+        None,
+        (instance.role_id, instance.is_active),
+    )
+
+
+@receiver(post_save, sender=User)
+def user_access_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or ACCESS_FIELDS & set(update_fields):
+        instance._loaded_access = (instance.role_id, instance.is_active)
+    if instance._access_changed:
+        instance._access_changed = False
+        # only this user's tokens: the rule matrix stays as it is
+        bump_user_access_epoch(instance.pk)
+        if not instance.is_active:
+            # soft delete: no more refreshes for this user
+            revoke_user_refresh_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_user_access_epoch(instance.pk)
@@ -1,3 +1,1119 @@
-from django.test import TestCase
+import json
+import jwt
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from asgiref.sync import async_to_sync
+from config import db_router
+from config.db_router import PrimaryReplicaRouter
+from config.introspect import asgi_introspect, wsgi_introspect
+from config.renderers import OrjsonParser, OrjsonRenderer
+from mockapp.models import Task
+from mockapp.serializers import TaskSerializer
+from users import hashing, rbac, throttling
+from users.cache import LRUCache, get_cached_user, invalidate_all_users
+from users.models import (
+    AccessRule,
+    BusinessElement,
+    Perm,
+    RbacVersion,
+    RefreshToken,
+    RevokedToken,
+    Role,
+    User,
+    UserAccessEpoch,
+)
+from users.permissions import AccessRulePermission
+from users.principal import (
+    get_principal,
+    get_user_from_request,
+    principal_from_token,
+)
+from users.revocation import BloomFilter, RevocationList, revoke_access_token
+from users.serializers import UserSerializer
+from users.services import (
+    create_access_token,
+    decode_access_token,
+    get_token_cache,
+    hash_password,
+    verify_password,
+)
+from users.tokens import issue_token_pair
 
-# Create your tests here.
+# full table scan in the plan: SQLite / PostgreSQL
+SEQ_SCAN = r"\bSCAN\b|Seq Scan"
+
+
+def explain(queryset) -> str:
+    if connection.vendor == "postgresql":
+        # test tables are tiny, so ask the planner which index it *can* use
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+def reset_caches():
+    # process-wide caches outlive the per-test rollback
+    rbac._matrix = None
+    throttling._counter = None
+    invalidate_all_users()
+    get_token_cache().clear()
+
+
+class QueryPlanTests(TestCase):
+    def test_login_lookup_uses_lower_email_index(self):
+        plan = explain(
+            User.objects.select_related("role").filter(email__lower="a@x.io")
+        )
+        self.assertIn("user_email_lower_uniq", plan)
+
+    def test_active_user_lookup_is_indexed(self):
+        plan = explain(User.objects.select_related("role").filter(id=1, is_active=True))
+        self.assertNotRegex(plan, SEQ_SCAN)
+
+    def test_rule_lookup_is_indexed(self):
+        plan = explain(AccessRule.objects.filter(role_id=1, element__code="task"))
+        self.assertNotRegex(plan, SEQ_SCAN)
+
+
+@override_settings(PASSWORD_HASHING={"POOL_SIZE": 0})
+class HotPathQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(role=role, element=element, can_read=True)
+        cls.user = User.objects.create(
+            full_name="U",
+            email="u@example.com",
+            password_hash=hash_password("secret1"),
+            role=role,
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def test_login(self):
+        # user with role in one query + the refresh token insert
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                "/api/auth/login/",
+                json.dumps({"email": "U@example.com", "password": "secret1"}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_me_is_served_from_caches(self):
+        self.client.get("/api/me/", **self.auth)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/me/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_me_not_modified(self):
+        etag = self.client.get("/api/me/", **self.auth)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/me/", HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # async twin, weak validator from a client
+        response = self.client.get(
+            "/api/async/me/", HTTP_IF_NONE_MATCH=f"W/{etag}", **self.auth
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.client.patch(
+            "/api/me/",
+            json.dumps({"full_name": "New"}),
+            content_type="application/json",
+            **self.auth,
+        )
+        response = self.client.get("/api/me/", HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class PrincipalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(role=role, element=element, can_read=True)
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        cls.other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=role
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def test_resolved_once_per_request(self):
+        request = RequestFactory().get("/api/tasks/", **self.auth)
+        with mock.patch(
+            "users.principal.decode_access_token", wraps=decode_access_token
+        ) as decode:
+            principal = get_principal(request)
+            # DRF's Request wraps the same django request
+            self.assertIs(get_principal(Request(request)), principal)
+            self.assertEqual(get_user_from_request(request).pk, self.user.pk)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_object_check_compares_owner_id(self):
+        request = Request(RequestFactory().get("/api/tasks/1/", **self.auth))
+        view = SimpleNamespace(element_code="task")
+        permission = AccessRulePermission()
+        self.assertTrue(permission.has_permission(request, view))
+
+        # rules are loaded, the owner is never fetched
+        with self.assertNumQueries(0):
+            own = Task(title="own", owner_id=self.user.id)
+            foreign = Task(title="foreign", owner_id=self.other.id)
+            self.assertTrue(permission.has_object_permission(request, view, own))
+            self.assertFalse(permission.has_object_permission(request, view, foreign))
+
+    def test_bad_token_is_anonymous(self):
+        request = RequestFactory().get("/api/me/", HTTP_AUTHORIZATION="Bearer nope")
+        self.assertFalse(get_principal(request).is_authenticated)
+        self.assertIsNone(get_user_from_request(request))
+
+
+@override_settings(RBAC_VERSION_CHECK_SECONDS=60)
+class RuleMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="user")
+        cls.element = BusinessElement.objects.create(code="task", name="Task")
+        cls.rule = AccessRule.objects.create(
+            role=cls.role, element=cls.element, can_read=True
+        )
+
+    def setUp(self):
+        reset_caches()
+
+    def test_masks(self):
+        self.assertEqual(self.rule.mask, Perm.READ)
+        rule = AccessRule(mask=Perm.UPDATE | Perm.DELETE_ALL)
+        self.assertEqual(
+            (rule.can_update, rule.can_delete_all, rule.can_read), (True, True, False)
+        )
+
+        matrix = rbac.get_rule_matrix()
+        self.assertEqual(matrix.role_masks(self.role.id), {"task": Perm.READ})
+        self.assertEqual(matrix.get(self.role.id, "order"), 0)
+        self.assertEqual(matrix.role_masks(None), {})
+
+    def test_change_from_another_worker_after_check_interval(self):
+        matrix = rbac.get_rule_matrix()
+        self.assertEqual(matrix.get(self.role.id, "task"), Perm.READ)
+
+        # another worker: rows and version change, no signals in this process
+        AccessRule.objects.filter(pk=self.rule.pk).update(can_update=True)
+        RbacVersion.objects.update(version=F("version") + 1)
+
+        with self.assertNumQueries(0):
+            self.assertIs(rbac.get_rule_matrix(), matrix)
+
+        later = time.monotonic() + 61
+        with mock.patch("users.rbac.time.monotonic", return_value=later):
+            fresh = rbac.get_rule_matrix()
+            self.assertEqual(fresh.version, matrix.version + 1)
+            self.assertEqual(fresh.get(self.role.id, "task"), Perm.READ | Perm.UPDATE)
+            # and the next check waits for the interval again
+            with self.assertNumQueries(0):
+                self.assertIs(rbac.get_rule_matrix(), fresh)
+
+    def test_local_change_is_seen_at_once(self):
+        rbac.get_rule_matrix()
+        self.rule.can_delete = True
+        self.rule.save()
+        self.assertTrue(rbac.get_rule_matrix().get(self.role.id, "task") & Perm.DELETE)
+
+    def test_import_bumps_version_once(self):
+        before = rbac.get_rbac_version()
+        grid = {
+            "user": {"task": {"can_read_all": True}, "order": {"can_read": True}},
+            "manager": {"task": {"can_update_all": True}},
+        }
+        self.assertEqual(
+            rbac.import_rule_grid(grid), {"created": 2, "updated": 1, "unchanged": 0}
+        )
+        self.assertEqual(rbac.get_rbac_version(), before + 1)
+        matrix = rbac.get_rule_matrix()
+        self.assertEqual(matrix.version, before + 1)
+        self.assertEqual(matrix.get(self.role.id, "task"), Perm.READ_ALL)
+
+        # nothing changed: no bump
+        rbac.import_rule_grid(grid)
+        self.assertEqual(rbac.get_rbac_version(), before + 1)
+
+    def test_grid_endpoint_is_admin_only(self):
+        admin = User.objects.create(
+            full_name="A",
+            email="a@example.com",
+            password_hash="-",
+            role=Role.objects.create(name="admin"),
+        )
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {create_access_token(admin.id)}"}
+        response = self.client.get("/api/access-rules/matrix/", **auth)
+        self.assertEqual(response.json()["rules"]["user"]["task"]["can_read"], True)
+
+        body = {"rules": {"user": {"task": {"can_update": True}}}}
+        response = self.client.put(
+            "/api/access-rules/matrix/", body, content_type="application/json", **auth
+        )
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(rbac.get_rule_matrix().get(self.role.id, "task"), Perm.UPDATE)
+
+        user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=self.role
+        )
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {create_access_token(user.id)}"}
+        response = self.client.get("/api/access-rules/matrix/", **auth)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(JWT_EMBED_PERMISSIONS=True, PASSWORD_HASHING={"POOL_SIZE": 0})
+class PermissionEpochTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="user")
+        cls.manager = Role.objects.create(name="manager")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(role=cls.role, element=element, can_read=True)
+        AccessRule.objects.create(role=cls.manager, element=element, can_read_all=True)
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=cls.role
+        )
+        cls.other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=cls.role
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.token = issue_token_pair(self.user)["access_token"]
+        self.other_token = issue_token_pair(self.other)["access_token"]
+
+    def assertFromClaims(self, token, expected=True):
+        # claims are trusted: no user and no rules loaded for the check
+        principal = principal_from_token(token)
+        self.assertEqual(principal._masks is not None, expected)
+        return principal
+
+    def test_current_token_needs_no_db(self):
+        principal_from_token(self.token)  # revocation filter
+
+        with self.assertNumQueries(0):
+            principal = self.assertFromClaims(self.token)
+        self.assertEqual(principal.get_mask("task"), Perm.READ)
+
+    def test_role_change_stales_only_that_user(self):
+        version = rbac.get_rbac_version()
+        user = User.objects.get(pk=self.user.pk)
+        user.role = self.manager
+        user.save()
+
+        self.assertEqual(rbac.get_rbac_version(), version)
+        self.assertEqual(UserAccessEpoch.objects.get(user_id=user.pk).epoch, 1)
+        # the worker reloads the new epochs, not the rules
+        self.assertFromClaims(self.token, expected=False)
+        with self.assertNumQueries(0):
+            self.assertFromClaims(self.other_token)
+
+        # a token issued after the change is trusted again, with the new role
+        token = issue_token_pair(user)["access_token"]
+        self.assertEqual(self.assertFromClaims(token).get_mask("task"), Perm.READ_ALL)
+
+    def test_soft_and_hard_delete(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertFromClaims(self.token, expected=False)
+        self.assertFalse(
+            RefreshToken.objects.filter(user=self.user, revoked_at=None).exists()
+        )
+
+        self.other.delete()
+        self.assertFromClaims(self.other_token, expected=False)
+        self.assertEqual(rbac.get_rule_matrix().user_epoch, 2)
+
+    def test_save_compares_loaded_fields(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.full_name = "New"
+        with self.assertNumQueries(1):  # the UPDATE only
+            user.save()
+        with self.assertNumQueries(1):
+            user.save(update_fields=["full_name", "updated_at"])
+        self.assertFalse(UserAccessEpoch.objects.exists())
+
+
+class UserCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="user")
+        cls.manager = Role.objects.create(name="manager")
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=cls.role
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def test_lru_and_ttl(self):
+        cache = LRUCache(max_size=2, ttl=30)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # "b" is the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+        later = time.monotonic() + 31
+        with mock.patch("users.cache.time.monotonic", return_value=later):
+            self.assertIsNone(cache.get("a"))
+
+    def test_cached_copy_and_invalidation(self):
+        user = get_cached_user(self.user.id)
+        with self.assertNumQueries(0):
+            cached = get_cached_user(self.user.id)
+        # callers get their own copy to mutate
+        self.assertIsNot(cached, user)
+        cached.full_name = "changed in memory"
+        self.assertEqual(get_cached_user(self.user.id).full_name, "U")
+
+        # a save through the ORM invalidates the entry in this worker
+        User.objects.get(pk=self.user.pk).save()
+        with self.assertNumQueries(1):
+            get_cached_user(self.user.id)
+
+        # cached users carry their role
+        self.role.name = "member"
+        self.role.save()
+        self.assertEqual(get_cached_user(self.user.id).role.name, "member")
+
+        self.user.delete()
+        self.assertIsNone(get_cached_user(self.user.id))
+
+    def test_patch_does_not_write_back_the_cached_copy(self):
+        self.client.get("/api/me/", **self.auth)
+        # another worker: new role, no invalidation here
+        User.objects.filter(pk=self.user.pk).update(role=self.manager)
+
+        response = self.client.patch(
+            "/api/me/",
+            json.dumps({"full_name": "New"}),
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.json()["role"], "manager")
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.full_name, user.role_id), ("New", self.manager.id))
+
+    def test_patch_after_soft_delete_elsewhere(self):
+        for path in ("/api/me/", "/api/async/me/"):
+            with self.subTest(path=path):
+                reset_caches()
+                self.client.get(path, **self.auth)
+                User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+                response = self.client.patch(
+                    path,
+                    json.dumps({"full_name": "New"}),
+                    content_type="application/json",
+                    **self.auth,
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+                User.objects.filter(pk=self.user.pk).update(is_active=True)
+
+
+@override_settings(PASSWORD_HASHING={"POOL_SIZE": 0})
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            full_name="U",
+            email="u@example.com",
+            password_hash=hash_password("secret1"),
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def login(self, password):
+        body = json.dumps({"email": "U@example.com", "password": password})
+        return self.client.post(
+            "/api/async/auth/login/", body, content_type="application/json"
+        )
+
+    def test_login(self):
+        response = self.login("secret1")
+        self.assertEqual(response.status_code, 200)
+        token = response.json()["access_token"]
+        self.assertEqual(decode_access_token(token)["user_id"], self.user.id)
+        self.assertEqual(self.login("secret2").status_code, 400)
+
+    def test_me_matches_sync(self):
+        response = self.client.get("/api/async/me/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content, self.client.get("/api/me/", **self.auth).content
+        )
+        self.assertEqual(self.client.get("/api/async/me/").status_code, 401)
+
+    def test_patch_and_soft_delete(self):
+        response = self.client.patch(
+            "/api/async/me/",
+            json.dumps({"full_name": "New"}),
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.json()["full_name"], "New")
+        self.assertEqual(User.objects.get(pk=self.user.pk).full_name, "New")
+
+        response = self.client.delete("/api/async/me/", **self.auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertEqual(
+            self.client.get("/api/async/me/", **self.auth).status_code, 401
+        )
+
+
+class PasswordHasherPoolTests(TestCase):
+    def blocked_pool(self, pool_size=1, max_queue=1, retry_after=3):
+        # threads instead of processes: the test controls when a "hash" ends
+        pool = hashing.PasswordHasherPool(pool_size, max_queue, retry_after)
+        pool._executor = ThreadPoolExecutor(pool_size)
+        self.addCleanup(pool._executor.shutdown)
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        return pool, gate
+
+    def test_saturated_pool_rejects(self):
+        pool, gate = self.blocked_pool()
+        running = pool.submit(hashing._timed, gate.wait, 5)
+        queued = pool.submit(hashing._timed, gate.wait, 5)
+
+        with self.assertRaises(hashing.HashingBusy) as cm:
+            pool.submit(hashing._timed, gate.wait, 5)
+        self.assertEqual(cm.exception.wait, 3)
+        self.assertEqual(cm.exception.status_code, 503)
+
+        gate.set()
+        self.assertTrue(running.result(5))
+        self.assertTrue(queued.result(5))
+        # slots are free again
+        self.assertTrue(pool.run(hashing._timed, gate.wait, 5))
+        stats = pool.stats()
+        self.assertEqual(
+            (stats["submitted"], stats["completed"], stats["rejected"]), (3, 3, 1)
+        )
+
+    @override_settings(PASSWORD_HASHING={"POOL_SIZE": 0})
+    def test_inline_without_pool(self):
+        self.assertIsNone(hashing.get_hasher_pool())
+        password_hash = hash_password("secret1")
+        self.assertTrue(verify_password("secret1", password_hash))
+        self.assertFalse(verify_password("secret2", password_hash))
+
+    def test_login_gets_503_with_retry_after(self):
+        with override_settings(PASSWORD_HASHING={"POOL_SIZE": 0}):
+            User.objects.create(
+                full_name="U",
+                email="u@example.com",
+                password_hash=hash_password("secret1"),
+            )
+
+        pool, gate = self.blocked_pool(max_queue=0, retry_after=7)
+        pool.submit(hashing._timed, gate.wait, 5)
+        body = json.dumps({"email": "u@example.com", "password": "secret1"})
+        with mock.patch.object(hashing, "_pool", pool):
+            for path in ("/api/auth/login/", "/api/async/auth/login/"):
+                response = self.client.post(path, body, content_type="application/json")
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(pool.rejected, 2)
+
+
+@override_settings(
+    AUTH_THROTTLE={"BACKEND": "local", "IP_RATE": "3/min", "EMAIL_RATE": "100/min"}
+)
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        reset_caches()
+
+    def login(self, email, path="/api/auth/login/", **extra):
+        body = json.dumps({"email": email, "password": "secret1"})
+        return self.client.post(path, body, content_type="application/json", **extra)
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    def test_ip_limit_ignores_forwarded_for(self):
+        for i in range(3):
+            response = self.login(
+                f"u{i}@example.com", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}"
+            )
+            self.assertEqual(response.status_code, 400)
+
+        # refused before the user lookup and bcrypt
+        for path in ("/api/auth/login/", "/api/async/auth/login/"):
+            with self.assertNumQueries(0):
+                response = self.login(
+                    "new@example.com", path, HTTP_X_FORWARDED_FOR="10.0.0.99"
+                )
+            self.assertThrottled(response)
+        # another client is not affected
+        response = self.login("new@example.com", REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(REST_FRAMEWORK={"NUM_PROXIES": 1})
+    def test_trusted_proxy_address(self):
+        # the proxy appends the client's address; whatever came before is forged
+        for i in range(3):
+            response = self.login(
+                f"u{i}@example.com", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}, 203.0.113.7"
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertThrottled(
+            self.login("u@example.com", HTTP_X_FORWARDED_FOR="10.0.0.9, 203.0.113.7")
+        )
+        response = self.login("u@example.com", HTTP_X_FORWARDED_FOR="203.0.113.8")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(AUTH_THROTTLE={"BACKEND": "local", "EMAIL_RATE": "2/min"})
+    def test_email_limit(self):
+        for i in range(2):
+            response = self.login("Victim@example.com", REMOTE_ADDR=f"192.0.2.{i}")
+            self.assertEqual(response.status_code, 400)
+        self.assertThrottled(self.login("victim@example.com", REMOTE_ADDR="192.0.2.9"))
+        response = self.client.post(
+            "/api/auth/register/",
+            json.dumps({"email": "victim@example.com"}),
+            content_type="application/json",
+        )
+        # separate scope for registration
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHING={"POOL_SIZE": 0})
+class TokenRevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            full_name="U",
+            email="u@example.com",
+            password_hash=hash_password("secret1"),
+        )
+
+    def setUp(self):
+        reset_caches()
+
+    def post(self, path, data, token=None):
+        extra = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.post(
+            path, json.dumps(data), content_type="application/json", **extra
+        )
+
+    def login(self):
+        response = self.post(
+            "/api/auth/login/", {"email": "u@example.com", "password": "secret1"}
+        )
+        return response.json()
+
+    def auth(self, token):
+        return {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def test_refresh_rotation_and_reuse(self):
+        first = self.login()["refresh_token"]
+        response = self.post("/api/auth/refresh/", {"refresh_token": first})
+        self.assertEqual(response.status_code, 200)
+        second = response.json()["refresh_token"]
+        self.assertNotEqual(second, first)
+
+        # the old token again: a leak, every session of the user is closed
+        response = self.post("/api/auth/refresh/", {"refresh_token": first})
+        self.assertEqual(response.status_code, 401)
+        response = self.post("/api/auth/refresh/", {"refresh_token": second})
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_revokes_access_token(self):
+        tokens = self.login()
+        other = self.login()["access_token"]
+        access = tokens["access_token"]
+        self.assertEqual(
+            self.client.get("/api/me/", **self.auth(access)).status_code, 200
+        )
+
+        response = self.post(
+            "/api/auth/logout/", {"refresh_token": tokens["refresh_token"]}, access
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.get("/api/me/", **self.auth(access)).status_code, 401
+        )
+        self.assertEqual(
+            self.client.get("/api/me/", **self.auth(other)).status_code, 200
+        )
+        response = self.post(
+            "/api/auth/refresh/", {"refresh_token": tokens["refresh_token"]}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_rebuild_picks_up_other_workers_and_does_not_write(self):
+        revocations = RevocationList(1000, 0.001, refresh_seconds=30)
+        self.assertFalse(revocations.is_revoked("a"))
+
+        expires_at = timezone.now() + timedelta(minutes=5)
+        RevokedToken.objects.create(jti="a", expires_at=expires_at)
+        # until the next rebuild this worker does not know
+        with self.assertNumQueries(0):
+            self.assertFalse(revocations.is_revoked("a"))
+
+        RevokedToken.objects.create(jti="old", expires_at=timezone.now())
+        with self.assertNumQueries(1):  # a SELECT of live jti, no DELETE
+            revocations.rebuild()
+        self.assertTrue(revocations.is_revoked("a"))
+        self.assertFalse(revocations.is_revoked("old"))
+        self.assertTrue(RevokedToken.objects.filter(jti="old").exists())
+
+    def test_purge_command(self):
+        RevokedToken.objects.create(jti="old", expires_at=timezone.now())
+        RevokedToken.objects.create(
+            jti="live", expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        out = StringIO()
+        call_command("purge_revoked_tokens", stdout=out)
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertEqual(
+            list(RevokedToken.objects.values_list("jti", flat=True)), ["live"]
+        )
+
+
+class TokenDecodeCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-"
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.token = create_access_token(self.user.id)
+
+    def principal(self, token):
+        request = RequestFactory().get("/api/me/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return get_principal(request)
+
+    def test_entry_lives_until_exp(self):
+        with mock.patch("users.services.jwt.decode", wraps=jwt.decode) as decode:
+            payload = decode_access_token(self.token)
+            decode_access_token(self.token)
+            self.assertEqual(decode.call_count, 1)
+
+            # past exp the entry is gone: the token is verified again
+            after_exp = time.monotonic() + payload["exp"] - time.time() + 1
+            with mock.patch("users.cache.time.monotonic", return_value=after_exp):
+                decode_access_token(self.token)
+            self.assertEqual(decode.call_count, 2)
+
+    def test_expired_token_is_not_cached(self):
+        expired = jwt.encode(
+            {"user_id": self.user.id, "exp": int(time.time()) - 1},
+            settings.SECRET_KEY,
+            algorithm="HS256",
+        )
+        for _ in range(2):
+            with self.assertRaises(jwt.ExpiredSignatureError):
+                decode_access_token(expired)
+        self.assertEqual(len(get_token_cache()), 0)
+
+    def test_secret_key_change_drops_cache(self):
+        decode_access_token(self.token)
+        with override_settings(SECRET_KEY="rotated"):
+            with self.assertRaises(jwt.InvalidSignatureError):
+                decode_access_token(self.token)
+
+    def test_revoked_token_is_rejected_on_cache_hit(self):
+        payload = decode_access_token(self.token)
+        self.assertEqual(self.principal(self.token).user_id, self.user.id)
+
+        revoke_access_token(payload)
+        with mock.patch("users.services.jwt.decode") as decode:
+            self.assertFalse(self.principal(self.token).is_authenticated)
+        decode.assert_not_called()  # claims from the cache, still rejected
+
+
+class FastJSONTests(TestCase):
+    # the fast paths must give exactly the bytes of the stock DRF ones
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        cls.user = User.objects.create(
+            full_name='Имя\u2028 "quoted" 😀',
+            email="u@example.com",
+            password_hash="-",
+            role=role,
+        )
+        cls.task = Task.objects.create(title="t", description="", owner=cls.user)
+
+    def assertSameRepresentation(self, serializer, instance):
+        fast = serializer.to_representation(instance)
+        drf = ModelSerializer.to_representation(serializer, instance)
+        self.assertEqual(list(fast.items()), list(drf.items()))
+        self.assertEqual(OrjsonRenderer().render(fast), JSONRenderer().render(drf))
+
+    def test_user_and_task_serializers(self):
+        user = User.objects.select_related("role").get(pk=self.user.pk)
+        self.assertSameRepresentation(UserSerializer(), user)
+        self.assertSameRepresentation(
+            TaskSerializer(), Task.objects.get(pk=self.task.pk)
+        )
+
+        # no role: DRF leaves "role" out
+        user.role = None
+        self.assertSameRepresentation(UserSerializer(), user)
+
+        user.created_at = datetime(2024, 1, 2, 3, 4, 5, 6789, tzinfo=dt_timezone.utc)
+        with timezone.override("Europe/Moscow"):
+            self.assertSameRepresentation(UserSerializer(), user)
+
+    def test_renderer(self):
+        data = {
+            "text": "".join(map(chr, range(0x3000))) + "\u2029",
+            1: [None, True, 2**70, -(2**63)],
+            "when": datetime(2024, 1, 2, tzinfo=dt_timezone.utc),
+        }
+        self.assertEqual(OrjsonRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(OrjsonRenderer().render(None), b"")
+
+    def test_parser_results_and_errors(self):
+        bodies = [
+            b'{"a": 1, "a": [1.5, "\\u2028", 123456789012345678901234567890]}',
+            b"",
+            b"[1,]",
+            b"NaN",
+            b"\xef\xbb\xbf{}",
+        ]
+        for body in bodies:
+            results = []
+            for parser in (JSONParser(), OrjsonParser()):
+                try:
+                    results.append(parser.parse(BytesIO(body)))
+                except ParseError as e:
+                    results.append(str(e.detail))
+            with self.subTest(body=body):
+                self.assertEqual(results[0], results[1])
+
+
+class IntrospectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="менеджер")
+        element = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(role=role, element=element, can_read=True)
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.token = create_access_token(self.user.id)
+
+    def introspect(self, token=None, query="", **headers):
+        environ = {"REQUEST_METHOD": "GET", "QUERY_STRING": query, **headers}
+        if token:
+            environ["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        response = {}
+
+        def start_response(status, response_headers):
+            response.update(response_headers, status=status)
+
+        self.assertEqual(b"".join(wsgi_introspect(environ, start_response)), b"")
+        return response
+
+    def test_token_only(self):
+        self.assertEqual(self.introspect()["status"], "401 Unauthorized")
+        self.assertEqual(self.introspect("garbage")["status"], "401 Unauthorized")
+
+        response = self.introspect(self.token)
+        self.assertEqual(response["status"], "200 OK")
+        self.assertEqual(response["X-User-Id"], str(self.user.id))
+        self.assertEqual(
+            response["X-User-Role"], "%D0%BC%D0%B5%D0%BD%D0%B5%D0%B4%D0%B6%D0%B5%D1%80"
+        )
+
+    def test_element_and_method(self):
+        # the first check loads the user and the rule matrix
+        self.introspect(self.token, HTTP_X_ELEMENT_CODE="task")
+
+        with self.assertNumQueries(0):
+            response = self.introspect(self.token, HTTP_X_ELEMENT_CODE="task")
+        self.assertEqual(response["status"], "200 OK")
+
+        response = self.introspect(
+            self.token, HTTP_X_ELEMENT_CODE="task", HTTP_X_ORIGINAL_METHOD="DELETE"
+        )
+        self.assertEqual(response["status"], "403 Forbidden")
+        self.assertEqual(response["X-User-Id"], str(self.user.id))
+        response = self.introspect(self.token, query="element=order")
+        self.assertEqual(response["status"], "403 Forbidden")
+
+    def test_asgi(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "query_string": b"element=task&method=PATCH",
+            "headers": [(b"authorization", f"Bearer {self.token}".encode())],
+        }
+        async_to_sync(asgi_introspect)(scope, None, send)
+        self.assertEqual(messages[0]["status"], 403)
+        self.assertIn(
+            (b"x-user-id", str(self.user.id).encode()), messages[0]["headers"]
+        )
+
+
+class AuthorizationBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="user")
+        task = BusinessElement.objects.create(code="task", name="Task")
+        AccessRule.objects.create(
+            role=role, element=task, can_read_all=True, can_update=True
+        )
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        cls.other = User.objects.create(
+            full_name="O", email="o@example.com", password_hash="-", role=role
+        )
+        cls.own = Task.objects.create(owner=cls.user, title="own")
+        cls.foreign = Task.objects.create(owner=cls.other, title="foreign")
+
+    def setUp(self):
+        reset_caches()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def batch(self, checks):
+        return self.client.post(
+            "/api/authz/batch/",
+            data={"checks": checks},
+            content_type="application/json",
+            **self.auth,
+        )
+
+    def test_decisions_with_one_owner_query(self):
+        checks = [
+            {"element": "task", "action": "read", "object_id": self.foreign.id},
+            # can_read_all, but there is no such task
+            {"element": "task", "action": "read", "object_id": 10**6},
+            {"element": "task", "action": "update"},
+            {"element": "task", "action": "update", "object_id": self.own.id},
+            {"element": "task", "action": "update", "object_id": self.foreign.id},
+            {"element": "task", "action": "update", "object_id": 10**6},
+            {"element": "task", "action": "delete", "owner_id": self.user.id},
+            {"element": "task", "action": "update", "owner_id": self.other.id},
+            {"element": "order", "action": "read"},
+        ]
+        self.batch(checks)  # user and rule matrix
+
+        with self.assertNumQueries(1):
+            response = self.batch(checks)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["decisions"],
+            [True, False, True, True, False, False, False, False, False],
+        )
+
+    def test_bad_requests(self):
+        response = self.batch([{"element": "task", "action": "fly"}])
+        self.assertEqual(response.status_code, 400)
+        response = self.batch(
+            [{"element": "task", "action": "read", "owner_id": 1, "object_id": 1}]
+        )
+        self.assertEqual(response.status_code, 400)
+
+        self.auth = {}
+        self.assertEqual(self.batch([]).status_code, 401)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-"
+        )
+
+    def setUp(self):
+        reset_caches()
+
+    def test_metrics_access(self):
+        # token only by default: localhost may be a reverse proxy for everyone
+        with override_settings(METRICS_ACCESS={"TOKEN": None}):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+        access = {"TOKEN": "scrape", "ALLOWED_IPS": ["10.0.0.0/8"]}
+        with override_settings(METRICS_ACCESS=access):
+            for remote_addr, headers, status in (
+                ("10.1.2.3", {}, 200),
+                ("127.0.0.1", {}, 403),
+                ("203.0.113.5", {"HTTP_AUTHORIZATION": "Bearer scrape"}, 200),
+                ("203.0.113.5", {"HTTP_AUTHORIZATION": "Bearer other"}, 403),
+            ):
+                response = self.client.get(
+                    "/metrics", REMOTE_ADDR=remote_addr, **headers
+                )
+                self.assertEqual(response.status_code, status, remote_addr)
+
+            # behind one proxy the address it appended counts, not the proxy's
+            with override_settings(REST_FRAMEWORK={"NUM_PROXIES": 1}):
+                for forwarded_for, status in (
+                    ("203.0.113.5, 10.1.2.3", 200),
+                    ("10.1.2.3, 203.0.113.5", 403),
+                ):
+                    response = self.client.get(
+                        "/metrics",
+                        REMOTE_ADDR="127.0.0.1",
+                        HTTP_X_FORWARDED_FOR=forwarded_for,
+                    )
+                    self.assertEqual(response.status_code, status, forwarded_for)
+
+    def test_serialize_stage_includes_serializer(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"}
+        to_representation = UserSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.02)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(UserSerializer, "to_representation", slow):
+            response = self.client.get("/api/me/", **auth)
+        stages = dict(
+            part.split(";dur=")
+            for part in response["Server-Timing"].split(", ")
+            if ";dur=" in part
+        )
+        self.assertGreaterEqual(float(stages["serialize"]), 20)
+
+
+@override_settings(DATABASE_REPLICAS={"ALIASES": ["replica1"], "PIN_SECONDS": 5})
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.addCleanup(db_router.finish_request)
+
+    def test_outside_requests_everything_goes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_request_reads_go_to_replica_until_it_writes(self):
+        db_router.start_request(pinned=False)
+        self.assertEqual(self.router.db_for_read(User), "replica1")
+        # the rule matrix is always built from the primary
+        self.assertEqual(self.router.db_for_read(AccessRule), "default")
+
+        self.assertEqual(self.router.db_for_write(User), "default")
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_pinned_request_reads_from_primary(self):
+        db_router.start_request(pinned=True)
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+
+@skipUnless(
+    settings.DATABASE_REPLICAS["ALIASES"],
+    "needs a replica, e.g. DB_ENGINE=django.db.backends.sqlite3 DB_REPLICAS=replica.sqlite3",
+)
+class ReadYourWritesTests(TransactionTestCase):
+    # two separate test databases and no replication between them:
+    # whatever is only in the primary shows where a read went.
+    # TransactionTestCase: inside TestCase's transaction every read is a primary read
+    databases = {"default", *settings.DATABASE_REPLICAS["ALIASES"]}
+
+    def setUp(self):
+        role = Role.objects.create(name="user")
+        self.user = User.objects.create(
+            full_name="U", email="u@example.com", password_hash="-", role=role
+        )
+        reset_caches()
+        cache.clear()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {create_access_token(self.user.id)}"
+        }
+
+    def get_me(self):
+        invalidate_all_users()
+        return self.client.get("/api/me/", **self.auth)
+
+    def test_writer_reads_from_primary_for_a_while(self):
+        # GET reads the replica, which has never seen this user
+        self.assertEqual(self.get_me().status_code, 401)
+
+        response = self.client.patch(
+            "/api/me/",
+            json.dumps({"full_name": "New"}),
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # pinned to the primary after the write
+        response = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["full_name"], "New")
+
+        # pin expired: back to the replica
+        cache.clear()
+        self.assertEqual(self.get_me().status_code, 401)
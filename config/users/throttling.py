@@ -0,0 +1,170 @@
+# Троттлинг /auth/login/ и /auth/register/ по IP и по email.
+# Отказываем до любой работы с БД и bcrypt: 10 000-я попытка подбора пароля
+# должна стоить словарь в памяти, а не 250 мс CPU.
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: Optional[str]):
+    # "10/min" -> (10, 60), same format as DRF rates
+    if not rate:
+        return None, None
+    num, period = rate.split("/")
+    return int(num), PERIODS[period[0]]
+
+
+def estimate(prev: int, curr: int, window_start: float, period: int, now: float):
+    # sliding window counter: previous fixed window weighted by its overlap
+    overlap = 1 - (now - window_start) / period
+    return prev * overlap + curr
+
+
+class LocalSlidingWindow:
+    """
+    Process-local sliding-window counters in N shards, each an LRU of at most
+    max_keys entries, so memory stays bounded however many IPs/emails we see.
+    Evicting a key only forgets its counter (fails open for that key).
+    """
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 4096, **options):
+        self.max_keys = max_keys_per_shard
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def hit(self, key: str, limit: int, period: int) -> Optional[float]:
+        """
+        Учитывает попытку и возвращает None, если лимит не превышен,
+        иначе — сколько секунд подождать (сама попытка не учитывается).
+        """
+        i = zlib.crc32(key.encode()) % len(self._shards)
+        shard, lock = self._shards[i], self._locks[i]
+
+        now = time.time()
+        window_start = now - now % period
+        with lock:
+            start, prev, curr = shard.get(key, (window_start, 0, 0))
+            if start != window_start:
+                # moved on: the old current window becomes the previous one
+                prev = curr if start == window_start - period else 0
+                curr = 0
+
+            if estimate(prev, curr, window_start, period, now) + 1 > limit:
+                shard[key] = (window_start, prev, curr)
+                shard.move_to_end(key)
+                return window_start + period - now
+
+            shard[key] = (window_start, prev, curr + 1)
+            shard.move_to_end(key)
+            if len(shard) > self.max_keys:
+                shard.popitem(last=False)
+            return None
+
+
+class CacheSlidingWindow:
+    """
+    Same counters in Django's cache (CACHES[alias]), shared between workers.
+    """
+
+    def __init__(self, alias: str = "default", **options):
+        self.alias = alias
+
+    def hit(self, key: str, limit: int, period: int) -> Optional[float]:
+        cache = caches[self.alias]
+        now = time.time()
+        window = int(now // period)
+        curr_key = f"throttle:{key}:{window}"
+        prev_key = f"throttle:{key}:{window - 1}"
+
+        counts = cache.get_many([prev_key, curr_key])
+        prev, curr = counts.get(prev_key, 0), counts.get(curr_key, 0)
+        window_start = window * period
+        if estimate(prev, curr, window_start, period, now) + 1 > limit:
+            return window_start + period - now
+
+        if not cache.add(curr_key, 1, period * 2):
+            cache.incr(curr_key)
+        return None
+
+
+THROTTLE_BACKENDS = {
+    "local": LocalSlidingWindow,
+    "django": CacheSlidingWindow,
+}
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_throttle_config() -> dict:
+    return {
+        "BACKEND": "local",
+        "IP_RATE": "30/min",
+        "EMAIL_RATE": "10/min",
+        "SHARDS": 16,
+        "MAX_KEYS_PER_SHARD": 4096,
+        "CACHE_ALIAS": "default",
+        **getattr(settings, "AUTH_THROTTLE", {}),
+    }
+
+
+def get_counter():
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                config = get_throttle_config()
+                _counter = THROTTLE_BACKENDS[config["BACKEND"]](
+                    shards=config["SHARDS"],
+                    max_keys_per_shard=config["MAX_KEYS_PER_SHARD"],
+                    alias=config["CACHE_ALIAS"],
+                )
+    return _counter
+
+
+def check_auth_throttle(scope: str, ip: Optional[str], email) -> Optional[float]:
+    """
+    None — попытку можно обрабатывать, иначе — секунды до следующей разрешённой.
+    """
+    config = get_throttle_config()
+    counter = get_counter()
+
+    checks = []
+    if ip:
+        checks.append((f"{scope}:ip:{ip}", config["IP_RATE"]))
+    if isinstance(email, str) and email.strip():
+        checks.append((f"{scope}:email:{email.strip().lower()}", config["EMAIL_RATE"]))
+
+    for key, rate in checks:
+        limit, period = parse_rate(rate)
+        if limit is None:
+            continue
+        wait = counter.hit(key, limit, period)
+        if wait is not None:
+            return wait
+    return None
+
+
+class AuthRateThrottle(BaseThrottle):
+    """
+    DRF throttle for auth views; the view sets throttle_scope ("login", "register").
+    Runs in APIView.initial(), before the serializer touches the DB or bcrypt.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", "auth")
+        data = request.data
+        email = data.get("email") if hasattr(data, "get") else None
+
+        self._wait = check_auth_throttle(scope, self.get_ident(request), email)
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
@@ -0,0 +1,92 @@
+# Пара токенов: короткий access (JWT) + refresh (случайная строка, в БД — только sha256).
+# Refresh-токен одноразовый: при обновлении старый отзывается и выдаётся новый.
+import hashlib
+import secrets
+from datetime import timedelta
+from typing import Optional
+from django.conf import settings
+from django.utils import timezone
+from .models import RefreshToken, User
+from .principal import build_permission_claims
+from .rbac import RuleMatrix
+from .services import create_access_token
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+def _hash(raw_token: str) -> str:
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def _new_refresh_token(user: User):
+    raw_token = secrets.token_urlsafe(32)
+    token = RefreshToken(
+        user=user,
+        token_hash=_hash(raw_token),
+        expires_at=timezone.now() + timedelta(days=settings.JWT_REFRESH_LIFETIME_DAYS),
+    )
+    return raw_token, token
+
+
+def _access_token(user: User, matrix: Optional[RuleMatrix] = None) -> str:
+    claims = None
+    if settings.JWT_EMBED_PERMISSIONS:
+        claims = build_permission_claims(user, matrix)
+    return create_access_token(user.id, claims)
+
+
+def issue_token_pair(user: User) -> dict:
+    raw_token, token = _new_refresh_token(user)
+    token.save()
+    return {"access_token": _access_token(user), "refresh_token": raw_token}
+
+
+async def aissue_token_pair(user: User, matrix: RuleMatrix) -> dict:
+    raw_token, token = _new_refresh_token(user)
+    await token.asave()
+    return {"access_token": _access_token(user, matrix), "refresh_token": raw_token}
+
+
+def rotate_refresh_token(raw_token: str):
+    """
+    Меняет refresh-токен на новую пару. Возвращает (user, pair).
+    Повторное использование уже отозванного токена считаем утечкой
+    и отзываем все refresh-токены пользователя.
+    """
+    token = (
+        RefreshToken.objects.select_related("user__role")
+        .filter(token_hash=_hash(raw_token))
+        .first()
+    )
+    if token is None:
+        raise InvalidRefreshToken("Invalid refresh token")
+
+    now = timezone.now()
+    if token.revoked_at is not None:
+        revoke_user_refresh_tokens(token.user_id)
+        raise InvalidRefreshToken("Refresh token has been revoked")
+    if token.expires_at <= now or not token.user.is_active:
+        raise InvalidRefreshToken("Refresh token has expired")
+
+    # compare-and-set: of two concurrent refreshes only one wins
+    used = RefreshToken.objects.filter(pk=token.pk, revoked_at__isnull=True).update(
+        revoked_at=now
+    )
+    if not used:
+        raise InvalidRefreshToken("Refresh token has been revoked")
+
+    return token.user, issue_token_pair(token.user)
+
+
+def revoke_refresh_token(raw_token: str):
+    RefreshToken.objects.filter(
+        token_hash=_hash(raw_token), revoked_at__isnull=True
+    ).update(revoked_at=timezone.now())
+
+
+def revoke_user_refresh_tokens(user_id: int):
+    RefreshToken.objects.filter(user_id=user_id, revoked_at__isnull=True).update(
+        revoked_at=timezone.now()
+    )
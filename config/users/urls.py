@@ -1,11 +1,17 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("auth/register/", views.RegisterView.as_view()),
     path("auth/login/", views.LoginView.as_view()),
+    path("auth/refresh/", views.RefreshView.as_view()),
     path("auth/logout/", views.LogoutView.as_view()),
     path("me/", views.MeView.as_view()),
+    path("authz/batch/", views.AuthorizationBatchView.as_view()),
     path("access-rules/", views.AccessRuleListCreateView.as_view()),
+    path("access-rules/matrix/", views.AccessRuleMatrixView.as_view()),
     path("access-rules/<int:pk>/", views.AccessRuleDetailView.as_view()),
+    # async (ASGI) variants
+    path("async/auth/login/", async_views.AsyncLoginView.as_view()),
+    path("async/me/", async_views.AsyncMeView.as_view()),
 ]
@@ -1,8 +1,12 @@
 from http import HTTPStatus
+from django.conf import settings
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from config.conditional import etag_matches, set_etag
+from .authorization import authorize_many, parse_checks
+from .cache import get_fresh_user
 from .models import AccessRule
 from .permissions import IsAdminRole
 from .serializers import (
@@ -11,13 +15,29 @@ from .serializers import (
     LoginSerializer,
     MeUpdateSerializer,
     AccessRuleSerializer,
+    RefreshSerializer,
+    LogoutSerializer,
+    AccessRuleMatrixSerializer,
+    user_etag,
+)
+from .principal import get_principal, get_user_from_request
+from .rbac import export_rule_grid, import_rule_grid
+from .revocation import revoke_access_token
+from .throttling import AuthRateThrottle
+from .tokens import (
+    InvalidRefreshToken,
+    issue_token_pair,
+    revoke_refresh_token,
+    revoke_user_refresh_tokens,
+    rotate_refresh_token,
 )
-from .services import create_access_token, get_user_from_request
 
 
 # POST /api/auth/register
 class RegisterView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
+    throttle_scope = "register"
 
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
@@ -31,6 +51,8 @@ class RegisterView(APIView):
 # POST /api/auth/login/
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
+    throttle_scope = "login"
 
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
@@ -38,10 +60,9 @@ class LoginView(APIView):
             return Response(serializer.errors, HTTPStatus.BAD_REQUEST)
 
         user = serializer.validated_data["user"]
-        token = create_access_token(user.id)
 
         data = {
-            "access_token": token,
+            **issue_token_pair(user),
             "token_type": "Bearer",
             "user": UserSerializer(user).data,
         }
@@ -49,11 +70,38 @@ class LoginView(APIView):
         return Response(data, HTTPStatus.OK)
 
 
+# POST /api/auth/refresh/
+class RefreshView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = RefreshSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        try:
+            user, pair = rotate_refresh_token(
+                serializer.validated_data["refresh_token"]
+            )
+        except InvalidRefreshToken as e:
+            return Response({"detail": str(e)}, HTTPStatus.UNAUTHORIZED)
+
+        data = {
+            **pair,
+            "token_type": "Bearer",
+            "user": UserSerializer(user).data,
+        }
+        return Response(data, HTTPStatus.OK)
+
+
 class MeView(APIView):
     def _get_current_user(self, request):
-        user = get_user_from_request(request)
-        print("VIEW USER:", user, type(user))
-        return user
+        return get_user_from_request(request)
+
+    def _get_user_for_update(self, request):
+        # writes start from the current row, not from the cached copy
+        user_id = get_principal(request).user_id
+        return get_fresh_user(user_id) if user_id is not None else None
 
     # GET /api/me/
     def get(self, request):
@@ -63,11 +111,15 @@ class MeView(APIView):
                 {"detail": "Authentication credentials were not provided."},
                 HTTPStatus.UNAUTHORIZED,
             )
-        return Response(UserSerializer(user).data, HTTPStatus.OK)
+        # polled a lot and rarely changed: 304 without serializing
+        etag = user_etag(user)
+        if etag_matches(request, etag):
+            return set_etag(Response(status=HTTPStatus.NOT_MODIFIED), etag)
+        return set_etag(Response(UserSerializer(user).data, HTTPStatus.OK), etag)
 
     # PATCH /api/me/
     def patch(self, request):
-        user = self._get_current_user(request)
+        user = self._get_user_for_update(request)
         if user is None:
             return Response(
                 {"detail": "Authentication credentials were not provided."},
@@ -83,17 +135,18 @@ class MeView(APIView):
             return Response(serializer.errors, HTTPStatus.BAD_REQUEST)
 
         data = serializer.validated_data
-        if "full_name" in data:
-            user.full_name = data["full_name"]
-        if "email" in data:
-            user.email = data["email"]
+        fields = [field for field in ("full_name", "email") if field in data]
+        for field in fields:
+            setattr(user, field, data[field])
 
-        user.save()
-        return Response(UserSerializer(user).data, HTTPStatus.OK)
+        user.save(update_fields=[*fields, "updated_at"])
+        return set_etag(
+            Response(UserSerializer(user).data, HTTPStatus.OK), user_etag(user)
+        )
 
     # DELETE /api/me/ — мягкое удаление
     def delete(self, request):
-        user = self._get_current_user(request)
+        user = self._get_user_for_update(request)
         if user is None:
             return Response(
                 {"detail": "Authentication credentials were not provided."},
@@ -101,17 +154,47 @@ class MeView(APIView):
             )
 
         user.is_active = False
-        user.save()
+        # refresh tokens are revoked by the users.signals
+        user.save(update_fields=["is_active", "updated_at"])
+        revoke_access_token(get_principal(request).claims)
         return Response(status=HTTPStatus.NO_CONTENT)
 
 
 class LogoutView(APIView):
     def post(self, request):
-        # Для stateless JWT мы на сервере ничего не храним,
-        # поэтому просто говорим клиенту "ок, считай себя разлогиненным".
+        serializer = LogoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        # текущий access-токен больше не принимается
+        principal = get_principal(request)
+        revoke_access_token(principal.claims)
+
+        # refresh-токен этой сессии; без него — все refresh-токены пользователя
+        refresh_token = serializer.validated_data.get("refresh_token")
+        if refresh_token:
+            revoke_refresh_token(refresh_token)
+        elif principal.is_authenticated:
+            revoke_user_refresh_tokens(principal.user_id)
+
         return Response({"detail": "Logged out"}, HTTPStatus.OK)
 
 
+# POST /api/authz/batch/ — решения по пакету проверок для вызывающего
+class AuthorizationBatchView(APIView):
+    def post(self, request):
+        principal = get_principal(request)
+        if not principal.is_authenticated:
+            return Response(
+                {"detail": "Authentication credentials were not provided."},
+                HTTPStatus.UNAUTHORIZED,
+            )
+
+        max_items = getattr(settings, "AUTHZ_BATCH_MAX_ITEMS", 1000)
+        checks = parse_checks(request.data, max_items)
+        return Response({"decisions": authorize_many(principal, checks)})
+
+
 class AccessRuleListCreateView(ListCreateAPIView):
     queryset = AccessRule.objects.select_related("role", "element")
     serializer_class = AccessRuleSerializer
@@ -122,3 +205,20 @@ class AccessRuleDetailView(RetrieveUpdateDestroyAPIView):
     queryset = AccessRule.objects.select_related("role", "element")
     serializer_class = AccessRuleSerializer
     permission_classes = [IsAdminRole]
+
+
+# GET/PUT /api/access-rules/matrix/ — вся сетка role × element разом
+class AccessRuleMatrixView(APIView):
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        return Response(export_rule_grid(), HTTPStatus.OK)
+
+    def put(self, request):
+        serializer = AccessRuleMatrixSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, HTTPStatus.BAD_REQUEST)
+
+        data = serializer.validated_data
+        stats = import_rule_grid(data["rules"], data.get("elements"))
+        return Response({**stats, **export_rule_grid()}, HTTPStatus.OK)